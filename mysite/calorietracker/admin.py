@@ -1,6 +1,18 @@
 from django.contrib import admin
 
-from .models import Setting, Log, Feedback, Streak, Subscription, MFPCredentials, Wallet
+from .models import (
+    AnalyticsSnapshot,
+    ImportJob,
+    MFPCacheEntry,
+    Feedback,
+    Log,
+    LogTombstone,
+    MFPCredentials,
+    Setting,
+    Streak,
+    Subscription,
+    Wallet,
+)
 
 admin.site.site_header = "CalorieTracker"
 admin.site.site_title = "CalorieTracker"
@@ -11,4 +23,8 @@ admin.site.register(Feedback)
 admin.site.register(Streak)
 admin.site.register(Subscription)
 admin.site.register(MFPCredentials)
-admin.site.register(Wallet)
\ No newline at end of file
+admin.site.register(Wallet)
+admin.site.register(AnalyticsSnapshot)
+admin.site.register(ImportJob)
+admin.site.register(MFPCacheEntry)
+admin.site.register(LogTombstone)
\ No newline at end of file
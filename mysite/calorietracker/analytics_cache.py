@@ -0,0 +1,78 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+# Cached contexts are keyed by date anyway, so they never need to outlive a day
+CONTEXT_TIMEOUT = 60 * 60 * 24
+# Part of the context keys, bump it when the context changes shape so the contexts
+# cached by an earlier release are not rendered with the new template
+CONTEXT_FORMAT = 2
+
+
+def version_key(kind, user_id):
+    return "calorietracker:analytics:%s-version:%d" % (kind, user_id)
+
+
+def bump_version(kind, user):
+    """
+    Invalidates every cached analytics context of user that depends on kind ("logs" or "settings").
+
+    Versions are random tokens rather than counters so a version key that was evicted never
+    comes back with a value an old context was cached under.
+    """
+    cache.set(version_key(kind, user.pk), uuid4().hex, None)
+
+
+def logs_changed(user):
+    bump_version("logs", user)
+
+
+def settings_changed(user):
+    bump_version("settings", user)
+
+
+def context_key(user, range_key, today):
+    """
+    Cache key of the analytics context of user for range_key on today, including the current
+    versions of their logs and settings.
+
+    Parameters
+    ----------
+    user : django user class
+    range_key : one of snapshots.RANGES
+        string
+    today : date the context was calculated on
+        datetime.date
+
+    Returns
+    -------
+    string
+    """
+
+    keys = [version_key("logs", user.pk), version_key("settings", user.pk)]
+    versions = cache.get_many(keys)
+    if len(versions) < len(keys):
+        for key in keys:
+            if key not in versions:
+                cache.add(key, uuid4().hex, None)
+        versions = cache.get_many(keys)
+
+    return "calorietracker:analytics:v%d:%d:%s:%s:%s:%s" % (
+        CONTEXT_FORMAT,
+        user.pk,
+        range_key,
+        versions.get(keys[0]),
+        versions.get(keys[1]),
+        today.isoformat(),
+    )
+
+
+def get_context(key):
+    """
+    Returns the (context, messages) pair cached under key, or None
+    """
+    return cache.get(key)
+
+
+def set_context(key, context, messages):
+    cache.set(key, (context, messages), CONTEXT_TIMEOUT)
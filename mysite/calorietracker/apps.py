@@ -6,6 +6,7 @@ class CalorietrackerConfig(AppConfig):
 
     def ready(self):
         import calorietracker.signals  # signal dependendcy
+        import calorietracker.mfp_throttle  # system check of the cache backend
 
         # Actsream
         # from actstream import registry
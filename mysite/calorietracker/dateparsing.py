@@ -0,0 +1,248 @@
+import re
+from datetime import date, datetime
+from itertools import product
+
+import dateutil.parser
+
+# How the import form's date_format maps onto dateutil
+DATEUTIL_OPTIONS = {
+    "MDY": {},
+    "DMY": {"dayfirst": True},
+    "YMD": {"yearfirst": True},
+    "YDM": {"yearfirst": True, "dayfirst": True},
+}
+
+# Number of dates a pattern is detected from
+SAMPLE_SIZE = 50
+
+MONTH_NAMES = {
+    name: month
+    for month, names in enumerate(
+        [
+            ("jan", "january"),
+            ("feb", "february"),
+            ("mar", "march"),
+            ("apr", "april"),
+            ("may",),
+            ("jun", "june"),
+            ("jul", "july"),
+            ("aug", "august"),
+            ("sep", "sept", "september"),
+            ("oct", "october"),
+            ("nov", "november"),
+            ("dec", "december"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+
+DIRECTIVES = {
+    "%Y": r"(?P<Y>\d{4})",
+    "%y": r"(?P<y>\d{2})",
+    "%m": r"(?P<m>\d{1,2})",
+    "%d": r"(?P<d>\d{1,2})",
+    "%b": r"(?P<b>[A-Za-z]+)",
+}
+
+
+def candidate_patterns():
+    """
+    The strptime patterns a column of dates is tried against, in order of preference
+    """
+
+    patterns = []
+    for order, year, separator in product(
+        ["mdy", "dmy", "ymd", "ydm", "md", "dm"], ["%Y", "%y"], ["/", "-", ".", " "]
+    ):
+        fields = {"m": "%m", "d": "%d", "y": year}
+        pattern = separator.join(fields[field] for field in order)
+        if pattern not in patterns:
+            patterns.append(pattern)
+
+    # Named months, e.g. "14-Jun" (the year defaults to the current one) or "Jun 14, 2020"
+    patterns += [
+        "%d-%b",
+        "%d %b",
+        "%b %d",
+        "%d-%b-%Y",
+        "%d-%b-%y",
+        "%d %b %Y",
+        "%b %d %Y",
+        "%b %d, %Y",
+        "%Y-%b-%d",
+    ]
+    return patterns
+
+
+def compile_pattern(pattern):
+    return re.compile(
+        "".join(
+            DIRECTIVES.get(token, re.escape(token))
+            for token in re.split("(%[a-zA-Z])", pattern)
+            if token
+        )
+        + r"\Z"
+    )
+
+
+def expand_year(year, today):
+    # dateutil puts two digit years within 50 years of today
+    year += today.year // 100 * 100
+    if year >= today.year + 50:
+        year -= 100
+    elif year < today.year - 50:
+        year += 100
+    return year
+
+
+def match_date(regex, value, today):
+    """
+    Returns the date regex matches in value, or None
+    """
+
+    match = regex.match(value)
+    if match is None:
+        return None
+    fields = match.groupdict()
+
+    if "Y" in fields:
+        year = int(fields["Y"])
+    elif "y" in fields:
+        year = expand_year(int(fields["y"]), today)
+    else:
+        year = today.year
+
+    if "b" in fields:
+        month = MONTH_NAMES.get(fields["b"].lower())
+        if month is None:
+            return None
+    else:
+        month = int(fields["m"])
+
+    try:
+        return date(year, month, int(fields["d"]))
+    except ValueError:
+        return None
+
+
+def parse_with_dateutil(value, date_format, today):
+    return dateutil.parser.parse(
+        value,
+        default=datetime(today.year, today.month, today.day),
+        **DATEUTIL_OPTIONS[date_format]
+    ).date()
+
+
+def ambiguous_dates_agree(pattern, date_format, years, today):
+    """
+    Whether dateutil reads the dates of years written in pattern as those dates, for all
+    dates whose day could be taken for the month (a day of 12 or less, other than the
+    month)
+
+    Samples rarely contain all of them. Without this, a file whose first rows all have
+    days above 12 could get a pattern dateutil reads differently on later rows.
+    """
+
+    if "%m" not in pattern:
+        # A named month cannot be mistaken for the day
+        return True
+    if "%Y" not in pattern and "%y" not in pattern:
+        years = [today.year]
+    for year, month, day in product(years, range(1, 13), range(1, 13)):
+        if day == month:
+            continue
+        probe = date(year, month, day)
+        try:
+            if (
+                parse_with_dateutil(probe.strftime(pattern), date_format, today)
+                != probe
+            ):
+                return False
+        except (ValueError, OverflowError):
+            return False
+    return True
+
+
+def detect_pattern(samples, date_format, today=None):
+    """
+    Finds the strptime pattern all of samples are written in
+
+    A pattern is only accepted if it reads every sample as the same date dateutil does
+    for date_format, and so every date of the samples' years whose day could be taken
+    for the month, see ambiguous_dates_agree. Rows that match it parse as they would
+    with dateutil.
+
+    Parameters
+    ----------
+    samples : date strings, e.g. the first rows of a csv column
+        list of string
+    date_format : one of "MDY", "DMY", "YMD", "YDM"
+        string
+    today : date year-less dates fall in the year of
+        datetime.date
+
+    Returns
+    -------
+    string or None if no pattern fits every sample
+    """
+
+    today = today or date.today()
+    samples = [sample.strip() for sample in samples if sample and sample.strip()]
+    expected = []
+    for sample in samples:
+        try:
+            expected.append((sample, parse_with_dateutil(sample, date_format, today)))
+        except (ValueError, OverflowError):
+            # Left to the per row fallback, which reports it
+            pass
+    if not expected:
+        return None
+
+    years = sorted({parsed.year for _, parsed in expected})
+    for pattern in candidate_patterns():
+        regex = compile_pattern(pattern)
+        if all(
+            match_date(regex, sample, today) == parsed for sample, parsed in expected
+        ) and ambiguous_dates_agree(pattern, date_format, years, today):
+            return pattern
+    return None
+
+
+def date_parser(date_format, samples, today=None):
+    """
+    Returns a function parsing a date string into a date
+
+    The pattern is detected once from samples. Values that do not match it, or all values
+    if none was found, are parsed with dateutil.
+
+    Parameters
+    ----------
+    date_format : one of "MDY", "DMY", "YMD", "YDM"
+        string
+    samples : date strings the pattern is detected from
+        list of string
+    today : date year-less dates fall in the year of
+        datetime.date
+
+    Returns
+    -------
+    function
+        parse(value) returning a datetime.date, raises ValueError or OverflowError like
+        dateutil.parser.parse
+    """
+
+    today = today or date.today()
+    pattern = detect_pattern(samples[:SAMPLE_SIZE], date_format, today)
+    regex = compile_pattern(pattern) if pattern else None
+
+    def parse(value):
+        value = value.strip()
+        if regex is not None:
+            parsed = match_date(regex, value, today)
+            if parsed is not None:
+                return parsed
+        return parse_with_dateutil(value, date_format, today)
+
+    parse.pattern = pattern
+    return parse
@@ -0,0 +1,314 @@
+import csv
+from datetime import datetime
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from measurement.measures import Weight
+
+from . import snapshots
+from .dateparsing import date_parser
+from .models import Log
+
+# Logs written per transaction
+CHUNK_SIZE = 500
+
+
+def to_log_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def existing_logs(user, first_day, last_day):
+    """
+    The logs merge_logs may write to on the dates from first_day to last_day
+    """
+
+    # Soft deleted logs still hold their (user, date) in the unique constraint. Every
+    # field bulk_update may write is loaded, a deferred one would be loaded per log
+    return Log.all_objects.filter(user=user, date__range=(first_day, last_day)).only(
+        "id", "date", "deleted", "weight", "weight_imputed", "calories_in"
+    )
+
+
+def merge_logs(user, overwrite, weights=None, calories_in=None, chunk_size=CHUNK_SIZE):
+    """
+    Merges imported weights and calories into the user's logs with a few bulk queries.
+
+    Dates the user has no log for get a new log with the imported values. A value that is
+    not imported is set to 0, as the single-column imports always did. Existing logs only
+    get the imported values if overwrite is True. A soft deleted log on an imported date
+    is restored as if it were new.
+
+    The existing logs of the imported range are loaded in one query. The logs are then
+    written with bulk_create/bulk_update in chunks of chunk_size dates, each in its own
+    transaction.
+
+    Parameters
+    ----------
+    user : django user class
+    overwrite : overwrite logged values with imported ones if True
+        bool
+    weights : imported weights
+        dict of {date: Weight}
+    calories_in : imported caloric intake
+        dict of {date: int}
+    chunk_size : number of dates written per transaction
+        int
+
+    Returns
+    -------
+    dict
+        number of logs created, updated and skipped (existing logs left alone)
+    """
+
+    weights = {to_log_date(day): value for day, value in (weights or {}).items()}
+    calories_in = {
+        to_log_date(day): value for day, value in (calories_in or {}).items()
+    }
+    dates = sorted(set(weights) | set(calories_in))
+    counts = {"created": 0, "updated": 0, "skipped": 0}
+    if not dates:
+        return counts
+
+    existing = {log.date: log for log in existing_logs(user, dates[0], dates[-1])}
+
+    for i in range(0, len(dates), chunk_size):
+        created, updated, update_fields = [], [], set()
+        for day in dates[i : i + chunk_size]:
+            log = existing.get(day)
+            if log is None:
+                created.append(
+                    Log(
+                        user=user,
+                        date=day,
+                        weight=weights.get(day, Weight(lb=0.0)),
+                        calories_in=calories_in.get(day, 0),
+                    )
+                )
+            elif log.deleted is not None:
+                log.deleted = None
+                log.weight = weights.get(day, Weight(lb=0.0))
+                log.weight_imputed = False
+                log.calories_in = calories_in.get(day, 0)
+                update_fields.update(
+                    ["deleted", "weight", "weight_imputed", "calories_in"]
+                )
+                updated.append(log)
+            elif overwrite:
+                if day in weights:
+                    log.weight = weights[day]
+                    log.weight_imputed = False
+                    update_fields.update(["weight", "weight_imputed"])
+                if day in calories_in:
+                    log.calories_in = calories_in[day]
+                    update_fields.add("calories_in")
+                updated.append(log)
+            else:
+                counts["skipped"] += 1
+
+        # bulk_update bypasses auto_now
+        now = timezone.now()
+        for log in updated:
+            log.updated_at = now
+        with transaction.atomic():
+            Log.objects.bulk_create(created)
+            if updated:
+                Log.all_objects.bulk_update(
+                    updated, sorted(update_fields | {"updated_at"})
+                )
+        counts["created"] += len(created)
+        counts["updated"] += len(updated)
+
+    # Bulk writes skip the Log signals
+    if counts["created"] or counts["updated"]:
+        snapshots.log_changed(user, dates[0])
+
+    return counts
+
+
+# CSV files are parsed and written in chunks of rows. Only the parsed values are kept
+# until the whole file is validated, not the rows
+CSV_CHUNK_SIZE = 1000
+CSV_HEADERS = ("Date", "Weight", "Calories_In")
+# Rows failing to parse after this many are only counted
+MAX_ERROR_MESSAGES = 100
+
+
+def read_csv_chunks(
+    reader,
+    indices,
+    date_format,
+    weight_units,
+    chunk_size=CSV_CHUNK_SIZE,
+):
+    """
+    Parses the rows of a csv reader positioned after the header, chunk_size rows at a time
+
+    Parameters
+    ----------
+    reader : csv.reader
+    indices : column index of each of "Date", "Weight" and "Calories_In"
+        dict
+    date_format : one of "MDY", "DMY", "YMD", "YDM"
+        string
+    weight_units : "lb" or "kg"
+        string
+    chunk_size : number of rows per chunk
+        int
+
+    Yields
+    ------
+    (rows, weights, calories_in, errors)
+        number of rows in the chunk, dict of {date: Weight}, dict of {date: int} and the
+        list of error messages of the rows in the chunk that failed to parse
+    """
+
+    date_index = indices["Date"]
+    weight_index = indices["Weight"]
+    calories_in_index = indices["Calories_In"]
+    parse_date = None
+
+    rows = enumerate(reader, start=1)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        if parse_date is None:
+            # The date pattern is detected once, from the first rows
+            parse_date = date_parser(
+                date_format,
+                [row[date_index] for _, row in chunk if date_index < len(row)],
+            )
+
+        weights, calories_in, errors = {}, {}, []
+        for row_number, row in chunk:
+            # Skip rows with empty cells
+            if any(
+                index >= len(row) or row[index] in (None, "")
+                for index in (date_index, weight_index, calories_in_index)
+            ):
+                continue
+
+            try:
+                date = parse_date(row[date_index])
+            except (ValueError, OverflowError):
+                errors.append(
+                    "Could not parse date: %s at row number %d"
+                    % (row[date_index], row_number)
+                )
+                continue
+
+            try:
+                if weight_units == "lb":
+                    weights[date] = Weight(lb=float(row[weight_index]))
+                elif weight_units == "kg":
+                    weights[date] = Weight(kg=float(row[weight_index]))
+            except ValueError:
+                errors.append(
+                    "Could not parse weight: %s at row number %d"
+                    % (row[weight_index], row_number)
+                )
+
+            try:
+                calories_in[date] = int(row[calories_in_index])
+            except ValueError:
+                errors.append(
+                    "Could not parse calories_in: %s at row number %d"
+                    % (row[calories_in_index], row_number)
+                )
+
+        yield len(chunk), weights, calories_in, errors
+
+
+def read_csv_header(reader):
+    """
+    Reads the header row of reader
+
+    Returns
+    -------
+    (indices, errors)
+        column index of each of CSV_HEADERS and error messages of the missing ones
+    """
+
+    available_headers = next(reader, None) or []
+    indices, errors = {}, []
+    for header in CSV_HEADERS:
+        try:
+            indices[header] = available_headers.index(header)
+        except ValueError:
+            errors.append("Missing header (case sensitive): " + header)
+    return indices, errors
+
+
+def import_csv(
+    user, f, overwrite, date_format, weight_units, progress=lambda **fields: None
+):
+    """
+    Imports the logs of a CSV file with Date, Weight and Calories_In columns
+
+    The file is read once. The whole file is validated first, so nothing is written if
+    any row fails to parse. The parsed chunks are then merged one by one, each in its own
+    transaction.
+
+    Parameters
+    ----------
+    user : django user class
+    f : CSV file opened in text mode, or any other iterable of its lines
+    overwrite : overwrite logged values with imported ones if True
+        bool
+    date_format : one of "MDY", "DMY", "YMD", "YDM"
+        string
+    weight_units : "lb" or "kg"
+        string
+    progress : called without arguments after each chunk validated, with rows_total
+        once the file was validated, then with rows_processed, logs_created and
+        logs_updated after each chunk merged
+        function
+
+    Returns
+    -------
+    list of error messages, empty if the file was imported
+    """
+
+    reader = csv.reader(f)
+    indices, errors = read_csv_header(reader)
+    if errors:
+        return errors
+
+    rows_total, more_errors, chunks = 0, 0, []
+    for rows, weights, calories_in, chunk_errors in read_csv_chunks(
+        reader, indices, date_format, weight_units
+    ):
+        rows_total += rows
+        room = max(MAX_ERROR_MESSAGES - len(errors), 0)
+        errors += chunk_errors[:room]
+        more_errors += len(chunk_errors[room:])
+        if errors:
+            chunks = []
+        else:
+            # Merged once the whole file turned out valid
+            chunks.append((rows, weights, calories_in))
+        # Nothing to report yet, but the job is still alive
+        progress()
+    if more_errors:
+        errors.append("and %d more errors" % more_errors)
+    if errors:
+        return errors
+    progress(rows_total=rows_total)
+
+    rows_processed, created, updated = 0, 0, 0
+    with snapshots.defer_refresh(user):
+        for rows, weights, calories_in in chunks:
+            counts = merge_logs(
+                user, overwrite, weights=weights, calories_in=calories_in
+            )
+            rows_processed += rows
+            created += counts["created"]
+            updated += counts["updated"]
+            progress(
+                rows_processed=rows_processed,
+                logs_created=created,
+                logs_updated=updated,
+            )
+    return []
@@ -0,0 +1,25 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic import DetailView, View
+
+from .jobs import job_progress
+from .models import ImportJob
+
+
+class ImportJobStatus(LoginRequiredMixin, DetailView):
+    """
+    Shows the progress of an import, polled from ImportJobProgress
+    """
+
+    template_name = "calorietracker/importjob.html"
+    context_object_name = "job"
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
+
+
+class ImportJobProgress(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, user=request.user)
+        return JsonResponse(job_progress(job))
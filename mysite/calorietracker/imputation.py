@@ -0,0 +1,157 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.utils import timezone
+from measurement.measures import Weight
+
+from .models import Log
+from .series import LogSeries
+
+# Logs written per transaction by backfill_imputed_weights
+BACKFILL_CHUNK_SIZE = 500
+# Nonzero weights averaged by default, the analytics snapshot imputes with it too so
+# the stored imputed weights match the ones it shows
+IMPUTATION_WINDOW = 10
+
+
+def impute_zero_weights(dates, weights, window=IMPUTATION_WINDOW):
+    """
+    Fills in weight=0 entries in a single O(n) pass.
+
+    Entries with a nonzero weight on both sides are linearly interpolated between the
+    previous and next nonzero weight, using the number of days between them so gaps in
+    the logs are accounted for.
+    Entries after the last nonzero weight get the average of the last 'window' nonzero weights before them.
+    Entries before the first nonzero weight get the average of the first 'window' nonzero weights.
+    If there are no nonzero weights at all nothing is imputed.
+
+    Parameters
+    ----------
+    dates : dates of the entries as day numbers (e.g. date.toordinal()), sorted ascending
+        array-like of float
+    weights : weights of the entries, 0 where no weight was logged. Any unit
+        array-like of float
+    window : number of nonzero weights to average where interpolation is not possible
+        int, default = 10
+
+    Returns
+    -------
+    (array, array)
+        imputed weights and a boolean mask of the entries that were imputed
+    """
+
+    dates = np.asarray(dates, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    n = len(weights)
+
+    nonzero = weights != 0
+    if not nonzero.any() or nonzero.all():
+        return weights.copy(), np.zeros(n, dtype=bool)
+    imputed = ~nonzero
+
+    indices = np.arange(n)
+
+    # Index of the previous/next nonzero weight for every entry, -1/n where there is none
+    prev_index = np.maximum.accumulate(np.where(nonzero, indices, -1))
+    next_index = np.minimum.accumulate(np.where(nonzero, indices, n)[::-1])[::-1]
+    has_prev = prev_index >= 0
+    has_next = next_index < n
+
+    output = weights.copy()
+
+    # Linear interpolation between the bounding nonzero weights
+    lerp = imputed & has_prev & has_next
+    p, q = prev_index[lerp], next_index[lerp]
+    slope = (weights[q] - weights[p]) / (dates[q] - dates[p])
+    output[lerp] = weights[p] + slope * (dates[lerp] - dates[p])
+
+    # Trailing means over the nonzero weights via prefix sums
+    nonzero_weights = weights[nonzero]
+    prefix = np.concatenate(([0.0], np.cumsum(nonzero_weights)))
+    # Number of nonzero weights up to and including each entry
+    rank = np.cumsum(nonzero)
+
+    trailing = imputed & has_prev & ~has_next
+    end = rank[trailing]
+    start = np.maximum(end - window, 0)
+    output[trailing] = (prefix[end] - prefix[start]) / (end - start)
+
+    leading = imputed & ~has_prev
+    count = min(window, len(nonzero_weights))
+    output[leading] = prefix[count] / count
+
+    return output, imputed
+
+
+def backfill_imputed_weights(
+    user, window=IMPUTATION_WINDOW, chunk_size=BACKFILL_CHUNK_SIZE
+):
+    """
+    Stores the imputed weight of each of the user's logs without a logged weight, for
+    anything reading Log.weight directly
+
+    Weights imputed by an earlier backfill count as not logged, so they are imputed again
+    from the logged ones. Only logs whose weight changed are written, with one bulk_update
+    per chunk_size logs, each in its own transaction. The analytics snapshot is not
+    affected, it imputes from the logged weights itself (see LogSeries.from_queryset).
+    The logs table shows the stored weights, marked as imputed.
+
+    Parameters
+    ----------
+    user : django user class
+    window : number of nonzero weights to average, see impute_zero_weights
+        int
+    chunk_size : number of logs written per transaction
+        int
+
+    Returns
+    -------
+    int
+        number of logs updated
+    """
+
+    logs = Log.objects.filter(user=user)
+    series = LogSeries.from_queryset(logs, ids=True)
+    imputed_weights, imputed = impute_zero_weights(
+        series.dates, series.weights, window=window
+    )
+    # {id: grams} of the weights imputed before
+    stored = dict(
+        logs.filter(weight_imputed=True)
+        .annotate(weight_g=ExpressionWrapper(F("weight"), output_field=FloatField()))
+        .values_list("id", "weight_g")
+    )
+
+    now = timezone.now()  # bulk_update bypasses auto_now
+    changed = []
+    for log_id, weight, is_imputed in zip(
+        series.ids.tolist(), imputed_weights.tolist(), imputed.tolist()
+    ):
+        if is_imputed:
+            if log_id in stored and abs(stored[log_id] - weight) < 1e-6:
+                continue
+            changed.append(
+                Log(
+                    id=log_id,
+                    weight=Weight(g=weight),
+                    weight_imputed=True,
+                    updated_at=now,
+                )
+            )
+        elif log_id in stored:
+            # Nothing to impute from anymore
+            changed.append(
+                Log(
+                    id=log_id,
+                    weight=Weight(g=0.0),
+                    weight_imputed=False,
+                    updated_at=now,
+                )
+            )
+
+    for i in range(0, len(changed), chunk_size):
+        with transaction.atomic():
+            Log.objects.bulk_update(
+                changed[i : i + chunk_size], ["weight", "weight_imputed", "updated_at"]
+            )
+    return len(changed)
@@ -0,0 +1,190 @@
+import logging
+from datetime import date, timedelta
+from io import TextIOWrapper
+
+import myfitnesspal
+from django.db.models import F
+from django.utils import timezone
+
+from . import mfpimport_views
+from .importer import import_csv
+from .mfp_sessions import with_session
+from .mfp_throttle import CircuitOpenError
+from .models import ImportJob, MFPCredentials
+
+logger = logging.getLogger("PrimaryLogger")
+
+# A running job whose progress was not saved for this long lost its worker
+STALE_AFTER = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def enqueue_csv(user, data_file, cleaned_data, encoding=None):
+    return ImportJob.objects.create(
+        user=user,
+        kind="C",
+        data_file=data_file,
+        options={
+            "overwrite": cleaned_data["csv_overwrite"],
+            "date_format": cleaned_data["date_format"],
+            "weight_units": cleaned_data["weight_units"],
+            "encoding": encoding,
+        },
+    )
+
+
+def enqueue_mfp(user, cleaned_data):
+    return ImportJob.objects.create(
+        user=user,
+        kind="M",
+        options={
+            "overwrite": cleaned_data["mfp_overwrite"],
+            "data_select": cleaned_data["mfp_data_select"],
+            "start_date": cleaned_data["mfp_start_date"].isoformat(),
+            "end_date": cleaned_data["mfp_end_date"].isoformat(),
+        },
+    )
+
+
+def requeue_stale_jobs():
+    """
+    Puts jobs back in the queue whose worker died while running them, or fails them
+    after MAX_ATTEMPTS
+    """
+
+    stale = ImportJob.objects.filter(
+        status="R", updated_at__lt=timezone.now() - STALE_AFTER
+    )
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status="F",
+        errors=["The import was interrupted too many times"],
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    stale.update(status="Q", updated_at=timezone.now())
+
+
+def claim_next_job():
+    """
+    Marks the oldest queued job as running and returns it, or None if the queue is empty.
+    Safe with several workers, a job is only claimed by the worker whose update changed it
+    """
+
+    while True:
+        job = ImportJob.objects.filter(status="Q").order_by("created_at").first()
+        if job is None:
+            return None
+        claimed = ImportJob.objects.filter(pk=job.pk, status="Q").update(
+            status="R",
+            attempts=F("attempts") + 1,
+            # A retried job starts over
+            rows_processed=0,
+            logs_created=0,
+            logs_updated=0,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def update_progress(job, **fields):
+    """
+    Saves fields on job and refreshes its updated_at, which keeps requeue_stale_jobs off
+    it. Without fields it only refreshes updated_at.
+    """
+
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save(update_fields=list(fields) + ["updated_at"])
+
+
+def run_job(job):
+    """
+    Runs a claimed job to completion, recording its outcome on it
+    """
+
+    try:
+        if job.kind == "C":
+            errors = run_csv_import(job)
+        else:
+            errors = run_mfp_import(job)
+    except CircuitOpenError:
+        errors = ["MyFitnessPal is not responding, please try again later"]
+    except Exception:
+        logger.exception("Import job %d failed", job.pk)
+        errors = ["The import failed unexpectedly, please try again later"]
+
+    update_progress(
+        job,
+        status="F" if errors else "D",
+        errors=errors,
+        finished_at=timezone.now(),
+    )
+    if job.data_file:
+        # The upload is not needed anymore once imported
+        job.data_file.delete(save=True)
+
+
+def run_csv_import(job):
+    with job.data_file.open("rb") as data_file:
+        f = TextIOWrapper(data_file, encoding=job.options["encoding"])
+        return import_csv(
+            job.user,
+            f,
+            job.options["overwrite"],
+            job.options["date_format"],
+            job.options["weight_units"],
+            progress=lambda **fields: update_progress(job, **fields),
+        )
+
+
+def run_mfp_import(job):
+    start_date = date.fromisoformat(job.options["start_date"])
+    end_date = date.fromisoformat(job.options["end_date"])
+    update_progress(job, rows_total=(end_date - start_date).days + 1)
+    try:
+        # An import whose session expires starts over after logging in again, the
+        # days already merged are merged again
+        with_session(
+            MFPCredentials.objects.defer("password").get(user=job.user),
+            lambda client: mfpimport_views.import_mfp(
+                job.user,
+                client,
+                job.options["data_select"],
+                job.options["overwrite"],
+                start_date,
+                end_date,
+                progress=lambda **fields: update_progress(job, **fields),
+            ),
+        )
+    except myfitnesspal.exceptions.MyfitnesspalLoginError:
+        return [
+            "Error connecting to MyFitnessPal with the provided information. Please check your MyFitnessPal account settings and try again."
+        ]
+    return []
+
+
+def job_progress(job):
+    """
+    Returns the progress of job as reported by the polling endpoint
+    """
+
+    return {
+        "id": job.pk,
+        "kind": job.get_kind_display(),
+        "status": job.get_status_display(),
+        "finished": job.status in ("D", "F"),
+        "rows_total": job.rows_total,
+        "rows_processed": job.rows_processed,
+        "percent": (
+            round(100 * job.rows_processed / job.rows_total)
+            if job.rows_total
+            else (100 if job.status == "D" else 0)
+        ),
+        "logs_created": job.logs_created,
+        "logs_updated": job.logs_updated,
+        "rows_per_second": round(job.throughput, 1),
+        "errors": job.errors,
+    }
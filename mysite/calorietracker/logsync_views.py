@@ -0,0 +1,180 @@
+from datetime import timedelta
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.generic import View
+
+from .models import Log, LogTombstone
+
+# Changes per page, clients may ask for fewer with ?limit=
+PAGE_SIZE = 500
+# A change only becomes visible when its transaction commits, possibly after a later
+# change. The watermark handed out stays this far behind the end of the sync so such a
+# change is sent again by the next sync rather than never
+WATERMARK_LAG = timedelta(seconds=60)
+CURSOR_SALT = "calorietracker.logsync"
+
+
+class LogChanges(LoginRequiredMixin, View):
+    """
+    The logs changed since a watermark, for clients that keep a copy of them
+
+    GET ?since=<watermark> returns the logs created or updated since then and the logs
+    deleted since then, a page at a time. Pass the returned next as ?cursor= to get the
+    following page. The last page has next null and the watermark to send as since on
+    the next sync. Without since every log is returned and nothing is deleted.
+
+    The logs are paged through by (updated_at, id), then the deleted ones, so each page
+    is a range scan of log_user_updated_idx or logtombstone_user_updated_idx. A change
+    can be sent twice but is never skipped, clients apply them by log id.
+    """
+
+    raise_exception = True
+
+    def get(self, request):
+        try:
+            position = self.get_position(request)
+            limit = min(int(request.GET.get("limit", PAGE_SIZE)), PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+        except (ValueError, signing.BadSignature):
+            return JsonResponse(
+                {"error": "Invalid since, cursor or limit parameter"}, status=400
+            )
+
+        changes = []
+        if position["phase"] == "logs":
+            changes = self.changed_logs(position, limit + 1)
+            if len(changes) > limit:
+                changes = changes[:limit]
+                position["after"] = self.after(changes[-1])
+            else:
+                position.update(phase="deleted", after=None)
+        remaining = limit - len(changes)
+        if position["phase"] == "deleted" and remaining:
+            deleted = self.deleted_logs(position, remaining + 1)
+            if len(deleted) > remaining:
+                deleted = deleted[:remaining]
+                position["after"] = self.after(deleted[-1])
+            else:
+                position["phase"] = "done"
+            changes += deleted
+
+        response = {
+            "logs": [self.log_data(log) for log in changes if log["log_id"] is None],
+            "deleted": [
+                {"id": log["log_id"], "date": log["date"]}
+                for log in changes
+                if log["log_id"] is not None
+            ],
+            "next": None,
+            "watermark": None,
+        }
+        if position["phase"] == "done":
+            response["watermark"] = parse_datetime(position["until"]) - WATERMARK_LAG
+        else:
+            response["next"] = signing.dumps(position, salt=CURSOR_SALT)
+        return JsonResponse(response)
+
+    def get_position(self, request):
+        """
+        Where the page starts, from the cursor of the previous page or the watermark
+
+        Returns
+        -------
+        dict
+            phase: "logs" or "deleted", the table being paged through
+            since, until: the changes between these ISO datetimes are sent, since is
+                None for all logs
+            after: [updated_at, id] of the last change sent in this phase or None
+        """
+
+        cursor = request.GET.get("cursor")
+        if cursor:
+            return signing.loads(cursor, salt=CURSOR_SALT)
+
+        since = request.GET.get("since") or None
+        if since is not None:
+            parsed = parse_datetime(since)
+            if parsed is None or timezone.is_naive(parsed):
+                raise ValueError("since must be a datetime with a time zone")
+            since = parsed.isoformat()
+        return {
+            "phase": "logs",
+            "since": since,
+            "until": timezone.now().isoformat(),
+            "after": None,
+        }
+
+    @staticmethod
+    def after(change):
+        return [change["updated_at"].isoformat(), change["id"]]
+
+    def changes(self, queryset, position):
+        queryset = queryset.filter(
+            user=self.request.user, updated_at__lte=position["until"]
+        )
+        if position["since"]:
+            queryset = queryset.filter(updated_at__gt=position["since"])
+        if position["after"]:
+            updated_at, pk = position["after"]
+            queryset = queryset.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk)
+            )
+        return queryset.order_by("updated_at", "id")
+
+    def changed_logs(self, position, limit):
+        """
+        Soft deleted logs are returned as deleted, except on a first sync which leaves
+        them out
+        """
+
+        logs = Log.all_objects if position["since"] else Log.objects
+        logs = (
+            self.changes(logs, position)
+            # The weight in grams, without building Weight objects
+            .annotate(
+                weight_g=ExpressionWrapper(F("weight"), output_field=FloatField())
+            ).values(
+                "id",
+                "date",
+                "weight_g",
+                "weight_imputed",
+                "calories_in",
+                "calories_out",
+                "activity_lvl",
+                "updated_at",
+                "deleted",
+            )
+        )
+        logs = list(logs[:limit])
+        # Like the tombstones, deletions have the id of the deleted log in log_id
+        for log in logs:
+            log["log_id"] = log["id"] if log["deleted"] else None
+        return logs
+
+    def deleted_logs(self, position, limit):
+        if not position["since"]:
+            return []
+        return list(
+            self.changes(LogTombstone.objects, position).values(
+                "id", "log_id", "date", "updated_at"
+            )[:limit]
+        )
+
+    @staticmethod
+    def log_data(log):
+        return {
+            "id": log["id"],
+            "date": log["date"],
+            "weight_kg": round((log["weight_g"] or 0) / 1000, 3),
+            "weight_imputed": log["weight_imputed"],
+            "calories_in": log["calories_in"],
+            "calories_out": log["calories_out"],
+            "activity_lvl": log["activity_lvl"],
+            "updated_at": log["updated_at"],
+        }
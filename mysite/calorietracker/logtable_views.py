@@ -0,0 +1,137 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.generic import View
+
+from .models import Log
+from .series import GRAMS_PER_KG, GRAMS_PER_LB
+from .user_settings import get_user_settings
+
+# Rows per page, clients may ask for fewer with ?limit=
+PAGE_SIZE = 100
+# ?order= values, a leading "-" sorts descending
+ORDER_FIELDS = {"date": "date", "weight": "weight_g", "calories_in": "calories_in"}
+CURSOR_SALT = "calorietracker.logtable"
+
+
+class LogTableData(LoginRequiredMixin, View):
+    """
+    A page of the user's logs for the table of ViewLogs
+
+    GET parameters
+    --------------
+    order : date, weight or calories_in, prefixed with "-" for descending (-date)
+    date_from, date_to : only logs of these dates or in between, YYYY-MM-DD
+    limit : rows per page, at most PAGE_SIZE
+    cursor : the next of the previous page, with the same order and filters
+
+    Pages are keyset paginated, see page_queryset. The first page (no cursor) also
+    counts the matching logs as total.
+    """
+
+    raise_exception = True
+
+    def get(self, request):
+        try:
+            order = request.GET.get("order", "-date")
+            column = ORDER_FIELDS[order.lstrip("-")]
+            descending = order.startswith("-")
+            limit = min(int(request.GET.get("limit", PAGE_SIZE)), PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be at least 1")
+            logs = self.filter(Log.objects.filter(user=request.user), request.GET)
+            cursor = request.GET.get("cursor")
+            after = signing.loads(cursor, salt=CURSOR_SALT) if cursor else None
+        except (KeyError, ValueError, signing.BadSignature):
+            return JsonResponse(
+                {"error": "Invalid order, date, limit or cursor parameter"}, status=400
+            )
+
+        total = None if after else logs.count()
+        rows = list(self.page_queryset(logs, column, descending, after)[: limit + 1])
+
+        grams_per_unit = GRAMS_PER_LB
+        if get_user_settings(request).unit_preference == "M":
+            grams_per_unit = GRAMS_PER_KG
+        response = {
+            "data": [
+                {
+                    "id": row["id"],
+                    "date": row["date"],
+                    "weight": round(row["weight_g"] / grams_per_unit, 2),
+                    "imputed": row["weight_imputed"],
+                    "calories_in": row["calories_in"],
+                }
+                for row in rows[:limit]
+            ],
+            "next": None,
+            "total": total,
+        }
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            value = last[column]
+            if column == "date":
+                value = value.isoformat()
+            response["next"] = signing.dumps([value, last["id"]], salt=CURSOR_SALT)
+        return JsonResponse(response)
+
+    @staticmethod
+    def page_queryset(logs, column, descending, after=None):
+        """
+        The rows of the page that follows after, ordered by column
+
+        A user has one log per date, so pages by date are ordered and continued by date
+        alone. They are range scans of log_user_date_live_idx that never touch the
+        table, however long the history is. Other columns are ordered by (column, id).
+
+        Parameters
+        ----------
+        logs : the user's logs
+            Log queryset
+        column : one of ORDER_FIELDS
+            string
+        descending : bool
+        after : [value of column, id] of the last row of the previous page, None for the
+            first page
+            list
+
+        Returns
+        -------
+        queryset of dicts with id, date, weight_g, weight_imputed and calories_in.
+            weight_g is the stored weight in grams, imputed ones included, 0 if none
+        """
+
+        logs = logs.annotate(
+            weight_g=Coalesce("weight", Value(0.0), output_field=FloatField())
+        )
+        lookup = "lt" if descending else "gt"
+        if column == "date":
+            ordering = ["date"]
+            if after:
+                logs = logs.filter(**{"date__%s" % lookup: after[0]})
+        else:
+            ordering = [column, "id"]
+            if after:
+                value, pk = after
+                logs = logs.filter(
+                    Q(**{"%s__%s" % (column, lookup): value})
+                    | Q(**{column: value, "pk__%s" % lookup: pk})
+                )
+        if descending:
+            ordering = ["-" + field for field in ordering]
+        return logs.order_by(*ordering).values(
+            "id", "date", "weight_g", "weight_imputed", "calories_in"
+        )
+
+    @staticmethod
+    def filter(logs, params):
+        for param, lookup in (("date_from", "date__gte"), ("date_to", "date__lte")):
+            if params.get(param):
+                day = parse_date(params[param])
+                if day is None:
+                    raise ValueError("%s is not a date" % param)
+                logs = logs.filter(**{lookup: day})
+        return logs
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from calorietracker.imputation import BACKFILL_CHUNK_SIZE, backfill_imputed_weights
+
+
+class Command(BaseCommand):
+    help = "Stores imputed weights on the logs without a logged weight"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="usernames",
+            metavar="USERNAME",
+            help="Only backfill this user, can be repeated",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BACKFILL_CHUNK_SIZE,
+            help="Logs written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        users = get_user_model().objects.filter(log__isnull=False).distinct()
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+
+        total = 0
+        for user in users.order_by("pk"):
+            updated = backfill_imputed_weights(user, chunk_size=options["chunk_size"])
+            total += updated
+            if updated:
+                self.stdout.write("%s: %d logs updated" % (user, updated))
+        self.stdout.write("%d logs updated" % total)
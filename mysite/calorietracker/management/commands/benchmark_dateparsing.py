@@ -0,0 +1,79 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calorietracker.dateparsing import (
+    DATEUTIL_OPTIONS,
+    date_parser,
+    parse_with_dateutil,
+)
+
+# How each date_format writes its dates, as in typical exports
+FORMATS = {
+    "MDY": "%m/%d/%Y",
+    "DMY": "%d.%m.%Y",
+    "YMD": "%Y-%m-%d",
+    "YDM": "%Y/%d/%m",
+}
+
+
+class Command(BaseCommand):
+    help = "Compares parsing csv import dates with dateutil per row and with a detected pattern"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=100000, help="Number of dates to parse"
+        )
+        parser.add_argument(
+            "--date-format",
+            choices=sorted(DATEUTIL_OPTIONS),
+            help="Only benchmark this format",
+        )
+        parser.add_argument(
+            "--strftime",
+            help="Write the dates with this pattern, e.g. %%d-%%b for year-less dates",
+        )
+
+    def handle(self, *args, **options):
+        if options["rows"] < 1:
+            raise CommandError("--rows must be at least 1")
+
+        today = date.today()
+        first_day = today - timedelta(days=options["rows"] - 1)
+        date_formats = (
+            [options["date_format"]] if options["date_format"] else DATEUTIL_OPTIONS
+        )
+        for date_format in date_formats:
+            strftime = options["strftime"] or FORMATS[date_format]
+            values = [
+                (first_day + timedelta(days=i)).strftime(strftime)
+                for i in range(options["rows"])
+            ]
+
+            start = time.perf_counter()
+            expected = [
+                parse_with_dateutil(value, date_format, today) for value in values
+            ]
+            dateutil_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parse = date_parser(date_format, values, today)
+            parsed = [parse(value) for value in values]
+            detected_seconds = time.perf_counter() - start
+
+            if parsed != expected:
+                raise CommandError(
+                    "%s: the detected pattern parsed dates differently" % date_format
+                )
+            self.stdout.write(
+                "%s (%s): dateutil %.3fs, pattern %s %.3fs, %.1fx faster"
+                % (
+                    date_format,
+                    strftime,
+                    dateutil_seconds,
+                    parse.pattern,
+                    detected_seconds,
+                    dateutil_seconds / detected_seconds,
+                )
+            )
@@ -0,0 +1,141 @@
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from measurement.measures import Weight
+
+from calorietracker.importer import existing_logs
+from calorietracker.logtable_views import PAGE_SIZE, LogTableData
+from calorietracker.models import Log
+from calorietracker.series import LogSeries
+
+INDEX_NAME = "log_user_date_live_idx"
+# Logs per user, about ten years of daily logs
+LOGS_PER_USER = 3650
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the query plans and timings of the hot Log queries with and without "
+        "the %s index" % INDEX_NAME
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[10000, 100000, 1000000],
+            help="Sizes of the Log table to benchmark",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs of each query, the best counts"
+        )
+
+    def handle(self, *args, **options):
+        if min(options["rows"]) < 1 or options["repeat"] < 1:
+            raise CommandError("--rows and --repeat must be at least 1")
+
+        for rows in options["rows"]:
+            # Nothing is kept, the table is filled and the index dropped in a
+            # transaction that is rolled back
+            with transaction.atomic():
+                user = self.fill(rows)
+                self.stdout.write(
+                    "%d logs, %d of the measured user"
+                    % (rows, Log.objects.filter(user=user).count())
+                )
+                self.run_queries(user, options["repeat"], "with index")
+                with connection.cursor() as cursor:
+                    cursor.execute("DROP INDEX %s" % INDEX_NAME)
+                self.run_queries(user, options["repeat"], "without index")
+                transaction.set_rollback(True)
+
+    def fill(self, rows):
+        """
+        Creates rows logs for users of LOGS_PER_USER logs each, returns the last user
+        """
+
+        first_day = date.today() - timedelta(days=LOGS_PER_USER)
+        prefix = "benchmark-%s-" % uuid4().hex[:8]
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(username=prefix + str(i))
+            for i in range(-(-rows // LOGS_PER_USER))
+        )
+        if connection.vendor != "postgresql":
+            # Only PostgreSQL sets the primary keys on bulk_create
+            users = list(
+                get_user_model()
+                .objects.filter(username__startswith=prefix)
+                .order_by("pk")
+            )
+        deleted = timezone.now()
+
+        logs = []
+        for i in range(rows):
+            day = i % LOGS_PER_USER
+            logs.append(
+                Log(
+                    user=users[i // LOGS_PER_USER],
+                    date=first_day + timedelta(days=day),
+                    weight=Weight(kg=80 + day % 7) if day % 5 else Weight(kg=0),
+                    calories_in=2000 + day % 300,
+                    # Every 50th log is soft deleted
+                    deleted=None if day % 50 else deleted,
+                )
+            )
+            if len(logs) == BATCH_SIZE:
+                Log.all_objects.bulk_create(logs)
+                logs = []
+        Log.all_objects.bulk_create(logs)
+        with connection.cursor() as cursor:
+            # Let the planner see the new rows
+            cursor.execute("ANALYZE")
+        return users[(rows - 1) // LOGS_PER_USER]
+
+    def run_queries(self, user, repeat, label):
+        logs = Log.objects.filter(user=user)
+        # The querysets of the code paths themselves
+        querysets = [
+            # Analytics snapshot refreshes
+            ("Analytics", LogSeries.values_queryset(logs), ""),
+            (
+                "Logs table page",
+                LogTableData.page_queryset(logs, "date", True)[:PAGE_SIZE],
+                "",
+            ),
+            (
+                "Import existence check",
+                existing_logs(
+                    user, date.today() - timedelta(days=LOGS_PER_USER), date.today()
+                ),
+                # Soft deleted logs are left out of log_user_date_live_idx
+                "reads soft deleted logs too, always on the unique (user, date) index",
+            ),
+        ]
+
+        explain = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        self.stdout.write("  %s:" % label)
+        for name, queryset, note in querysets:
+            seconds = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    list(queryset.all())
+                    seconds.append(time.perf_counter() - start)
+            self.stdout.write("    %s: %.2fms" % (name, min(seconds) * 1000))
+            if note:
+                self.stdout.write("      (%s)" % note)
+            # The plan of the query as sent, QuerySet.explain() would miss the
+            # deleted IS NULL filter safedelete only adds on evaluation. The label
+            # keeps sqlite3 from reusing the plan prepared before the index was dropped
+            with connection.cursor() as cursor:
+                cursor.execute("%s/* %s */ %s" % (explain, label, captured[0]["sql"]))
+                for row in cursor.fetchall():
+                    self.stdout.write("      %s" % row[-1])
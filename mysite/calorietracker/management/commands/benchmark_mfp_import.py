@@ -0,0 +1,139 @@
+import sys
+import time
+from datetime import date, timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from calorietracker.mfp_fake import FakeMFPServer
+from calorietracker.mfp_fetch import RETRY_EXCEPTIONS
+from calorietracker.mfp_throttle import CircuitOpenError
+from calorietracker.mfpimport_views import import_mfp
+from calorietracker.models import MFPCacheEntry
+
+
+class Command(BaseCommand):
+    help = "Measures MyFitnessPal import throughput against a local fake MyFitnessPal server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=365, help="Number of days imported"
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Average seconds the server takes per request",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Share of requests the server drops, from 0 to 1",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.MFP_FETCH_CONCURRENCY,
+            help="Days fetched at a time",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=settings.MFP_FETCH_RETRIES,
+            help="Retries of a failed request. The weights come from one request per "
+            "20 days retried as a whole, high error rates need more",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            default=0,
+            help="Requests per second, 0 for no limit",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1:
+            raise CommandError("--days must be at least 1")
+        if not 0 <= options["error_rate"] <= 1:
+            raise CommandError("--error-rate must be between 0 and 1")
+
+        end_date = date.today()
+        start_date = end_date - timedelta(days=options["days"] - 1)
+        # Nothing cached for this account yet
+        username = "benchmark-%s" % uuid4().hex[:8]
+        server = FakeMFPServer(
+            history_days=options["days"],
+            latency=options["latency"],
+            error_rate=options["error_rate"],
+            username=username,
+        )
+        # The rate limiter, circuit breaker and session pool of the running site keep
+        # their state in the default cache, the benchmark gets a cache of its own
+        isolated_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "benchmark-mfp-import",
+            }
+        }
+        # Each chunk is committed as in a real import, so the benchmark user and the days
+        # it cached are deleted afterwards instead of rolled back. The injected errors
+        # are not an outage, the circuit breaker is kept from opening on them
+        with server, override_settings(
+            CACHES=isolated_cache,
+            MFP_FETCH_CONCURRENCY=options["concurrency"],
+            MFP_RATE_LIMIT=options["rate_limit"],
+            MFP_FETCH_RETRIES=options["retries"],
+            MFP_BREAKER_THRESHOLD=sys.maxsize,
+        ):
+            try:
+                self.run(server, username, start_date, end_date, options)
+            finally:
+                get_user_model().objects.filter(username=username).delete()
+                MFPCacheEntry.objects.filter(username=username).delete()
+                cache.clear()
+
+    def run(self, server, username, start_date, end_date, options):
+        """
+        Imports the diaries twice, the second time from the MFPCacheEntry rows the
+        first import created, then the weights
+        """
+
+        client = server.client()
+        user = get_user_model().objects.create(username=username)
+        for label, data_select in [
+            ("Diaries", "CI"),
+            ("Diaries (cached)", "CI"),
+            ("Weights", "Weights"),
+        ]:
+            requests, failed = server.requests, server.failed_requests
+            start = time.perf_counter()
+            try:
+                counts = import_mfp(
+                    user, client, data_select, True, start_date, end_date
+                )
+            except CircuitOpenError as e:
+                raise CommandError("%s: %s" % (label, e))
+            except RETRY_EXCEPTIONS as e:
+                raise CommandError(
+                    "%s: a request still failed after %d retries, try more with "
+                    "--retries: %s" % (label, options["retries"], e)
+                )
+            seconds = time.perf_counter() - start
+            self.stdout.write(
+                "%s: %d days in %.2fs, %.1f days/s, %d requests (%d failed), "
+                "%d logs created, %d updated"
+                % (
+                    label,
+                    options["days"],
+                    seconds,
+                    options["days"] / seconds,
+                    server.requests - requests,
+                    server.failed_requests - failed,
+                    counts["created"],
+                    counts["updated"],
+                )
+            )
@@ -0,0 +1,160 @@
+import json
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from calorietracker import payloads
+from calorietracker.analytics_view import WEEKLY_FIELDS
+
+
+def legacy_dumps(data):
+    # How the pages serialized their tables before payloads.py
+    return json.dumps(data, sort_keys=True, indent=1, cls=DjangoJSONEncoder)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the size and encode time of the chart and table payloads of "
+        "payloads.py with the sorted, indented JSON of lists of dicts they replaced"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            nargs="+",
+            default=[365, 3650],
+            help="Lengths of the synthetic log history",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Runs of each encoding, the best counts",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["days"]) < 1 or options["repeat"] < 1:
+            raise CommandError("--days and --repeat must be at least 1")
+
+        for days in options["days"]:
+            self.stdout.write("%d days of logs:" % days)
+            for name, legacy, columnar in self.payloads(days):
+                legacy_bytes, legacy_seconds = self.measure(legacy, options["repeat"])
+                size, seconds = self.measure(columnar, options["repeat"])
+                self.stdout.write(
+                    "  %s: %d -> %d bytes (%.0f%%), %.2f -> %.2fms (%.1fx)"
+                    % (
+                        name,
+                        legacy_bytes,
+                        size,
+                        100 * size / legacy_bytes,
+                        legacy_seconds * 1000,
+                        seconds * 1000,
+                        legacy_seconds / seconds,
+                    )
+                )
+
+    def payloads(self, days):
+        """
+        Synthetic data of each payload, encoded the old and the new way
+
+        Returns
+        -------
+        list of (name, function returning the old payload, function returning the new)
+        """
+
+        rng = random.Random(days)
+        first = date.today().toordinal() - days + 1
+        ordinals = list(range(first, first + days))
+        weights = [round(rng.uniform(150, 200), 2) for _ in ordinals]
+        calories_in = [rng.randint(1200, 3500) for _ in ordinals]
+        ids = list(range(1, days + 1))
+        weekly = [
+            {
+                "week_number": i,
+                "weeks": "%s - %s"
+                % (
+                    date.fromordinal(first + i * 7).strftime("%b-%-d"),
+                    date.fromordinal(first + i * 7 + 6).strftime("%b-%-d"),
+                ),
+                "weeklycalories_in_mean": rng.randint(1200, 3500),
+                "weeklycalories_in_total": rng.randint(8400, 24500),
+                "TDEE": rng.randint(1800, 3000) if i else "N/A",
+                "weeklyweights": round(rng.uniform(150, 200), 2),
+                "weeklyweightchange": round(rng.uniform(-2, 2), 2) if i else 0.0,
+            }
+            for i in range(-(-days // 7))
+        ]
+
+        def legacy_chart():
+            # Each list was rendered on its own, the labels with a strftime per day
+            return "".join(
+                [
+                    json.dumps(
+                        [date.fromordinal(d).strftime("%b-%d") for d in ordinals]
+                    ),
+                    str(weights),
+                    str(calories_in),
+                ]
+            )
+
+        def chart():
+            return payloads.dumps(
+                {
+                    "days": payloads.epoch_days(ordinals),
+                    "weights": weights,
+                    "calories_in": calories_in,
+                }
+            )
+
+        def legacy_logs_table():
+            return legacy_dumps(
+                {
+                    "data": [
+                        {
+                            "id": ids[i],
+                            "date": date.fromordinal(ordinals[i]),
+                            "weight": weights[i],
+                            "calories_in": calories_in[i],
+                        }
+                        for i in range(days)
+                    ]
+                }
+            )
+
+        def logs_table():
+            return payloads.dumps(
+                {
+                    "id": ids,
+                    "date": payloads.iso_dates(ordinals),
+                    "weight": weights,
+                    "calories_in": calories_in,
+                }
+            )
+
+        return [
+            ("Analytics charts", legacy_chart, chart),
+            (
+                "Weekly table",
+                lambda: legacy_dumps({"data": weekly}),
+                lambda: payloads.dumps(payloads.columns(weekly, WEEKLY_FIELDS)),
+            ),
+            # As ViewLogs embedded it before the table was paginated
+            ("Logs table", legacy_logs_table, logs_table),
+        ]
+
+    def measure(self, encode, repeat):
+        """
+        Returns the size of the payload in bytes and the fastest of repeat encodings
+        """
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            payload = encode()
+            seconds.append(time.perf_counter() - start)
+        return len(payload.encode()), min(seconds)
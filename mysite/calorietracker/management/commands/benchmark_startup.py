@@ -0,0 +1,106 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that should only be loaded when a code path actually needs them
+HEAVY_MODULES = ["pandas", "statsmodels", "sklearn", "scipy"]
+
+# Runs in a fresh interpreter, the way a gunicorn worker boots
+PROBE = """
+import json, resource, sys, time
+
+start = time.perf_counter()
+import mysite.wsgi
+wsgi_seconds = time.perf_counter() - start
+
+if {load_urls}:
+    # The first request also imports the URLconf and with it every view module
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+total_seconds = time.perf_counter() - start
+
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(
+    json.dumps(
+        {{
+            "wsgi_seconds": wsgi_seconds,
+            "total_seconds": total_seconds,
+            "maxrss_mb": maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+            "heavy_modules": [m for m in {heavy_modules!r} if m in sys.modules],
+        }}
+    )
+)
+"""
+
+
+class Command(BaseCommand):
+    requires_system_checks = False
+    help = "Measures import time and peak RSS of a fresh worker loading mysite.wsgi"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--runs", type=int, default=5, help="Number of fresh processes to start"
+        )
+        parser.add_argument(
+            "--no-urls",
+            action="store_true",
+            help="Only import mysite.wsgi, without loading the URLconf and views",
+        )
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError("--runs must be at least 1")
+
+        probe = PROBE.format(
+            load_urls=not options["no_urls"], heavy_modules=HEAVY_MODULES
+        )
+
+        results = []
+        for run in range(options["runs"]):
+            process = subprocess.run(
+                [sys.executable, "-c", probe],
+                cwd=settings.BASE_DIR,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            if process.returncode != 0:
+                raise CommandError("Worker failed to start:\n" + process.stderr)
+            # Settings may log to stdout, the measurements are on the last line
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            results.append(result)
+            self.stdout.write(
+                "run %d: wsgi %.3fs, total %.3fs, peak RSS %.1f MB"
+                % (
+                    run + 1,
+                    result["wsgi_seconds"],
+                    result["total_seconds"],
+                    result["maxrss_mb"],
+                )
+            )
+
+        self.stdout.write(
+            "median: wsgi %.3fs, total %.3fs, peak RSS %.1f MB"
+            % (
+                statistics.median(r["wsgi_seconds"] for r in results),
+                statistics.median(r["total_seconds"] for r in results),
+                statistics.median(r["maxrss_mb"] for r in results),
+            )
+        )
+
+        heavy_modules = results[-1]["heavy_modules"]
+        if heavy_modules:
+            self.stdout.write(
+                self.style.WARNING("Loaded at startup: " + ", ".join(heavy_modules))
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "None of %s loaded at startup" % ", ".join(HEAVY_MODULES)
+                )
+            )
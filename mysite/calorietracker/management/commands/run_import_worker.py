@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from calorietracker import jobs
+
+
+class Command(BaseCommand):
+    help = "Runs queued CSV and MyFitnessPal imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for new jobs",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait between polls of an empty queue",
+        )
+
+    def handle(self, *args, **options):
+        if options["sleep"] <= 0:
+            raise CommandError("--sleep must be positive")
+
+        while True:
+            close_old_connections()
+            jobs.requeue_stale_jobs()
+            job = jobs.claim_next_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write("Running import job %d (%s)" % (job.pk, job.kind))
+            jobs.run_job(job)
+            self.stdout.write(
+                "Import job %d %s: %d rows, %d logs created, %d logs updated"
+                % (
+                    job.pk,
+                    job.get_status_display().lower(),
+                    job.rows_processed,
+                    job.logs_created,
+                    job.logs_updated,
+                )
+            )
@@ -0,0 +1,80 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import myfitnesspal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from calorietracker.mfp_sync import sync_user
+from calorietracker.models import MFPCredentials
+
+logger = logging.getLogger("PrimaryLogger")
+
+
+def sync(credentials):
+    try:
+        return sync_user(credentials), None
+    except myfitnesspal.exceptions.MyfitnesspalLoginError:
+        return None, "login failed"
+    except Exception as e:
+        logger.exception("MyFitnessPal sync of %s failed", credentials.user)
+        return None, str(e) or type(e).__name__
+    finally:
+        # Each worker thread has its own connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Imports what users logged on MyFitnessPal since their last sync"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.MFP_SYNC_WORKERS,
+            help="Number of users synced at a time",
+        )
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="usernames",
+            metavar="USERNAME",
+            help="Only sync this user, can be repeated",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        # The password is only loaded if a user has to log in again
+        credentials = (
+            MFPCredentials.objects.select_related("user")
+            .defer("password")
+            .order_by("pk")
+        )
+        if options["usernames"]:
+            credentials = credentials.filter(user__username__in=options["usernames"])
+
+        credentials = list(credentials)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = executor.map(sync, credentials)
+            for mfp, (counts, error) in zip(credentials, results):
+                if error:
+                    failed += 1
+                    self.stderr.write("%s: %s" % (mfp.user, error))
+                else:
+                    self.stdout.write(
+                        "%s: %d days, %d logs created, %d logs updated, %d kept"
+                        % (
+                            mfp.user,
+                            counts["days"],
+                            counts["created"],
+                            counts["updated"],
+                            counts["skipped"],
+                        )
+                    )
+
+        if failed:
+            raise CommandError("%d of %d syncs failed" % (failed, len(credentials)))
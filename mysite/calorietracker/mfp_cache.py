@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.utils import timezone
+from measurement.measures import Energy, Mass, Weight
+
+from .mfp_fetch import date_range, fetch_dates, with_retries
+from .models import MFPCacheEntry
+
+
+def is_fresh(date, fetched_at, now):
+    """
+    A day fetched well after it ended can no longer change, a recent one is refetched
+    after settings.MFP_CACHE_TTL seconds
+    """
+
+    if fetched_at is None:
+        return False
+    if (fetched_at.date() - date).days >= settings.MFP_CACHE_SETTLED_DAYS:
+        return True
+    return (now - fetched_at).total_seconds() < settings.MFP_CACHE_TTL
+
+
+def serialize_totals(totals):
+    """
+    Diary totals as plain numbers, energy in Calories and masses in grams
+    """
+
+    serialized = {}
+    for name, value in totals.items():
+        if isinstance(value, Energy):
+            serialized[name] = value.C
+        elif isinstance(value, Mass):
+            serialized[name] = value.g
+        else:
+            serialized[name] = float(value)
+    return serialized
+
+
+def load_entries(username, start_date, end_date):
+    return {
+        entry.date: entry
+        for entry in MFPCacheEntry.objects.filter(
+            username=username, date__range=(start_date, end_date)
+        )
+    }
+
+
+def iter_day_totals(client, start_date, end_date):
+    """
+    Diary totals of each day of a date range, fetched from MyFitnessPal only if the cached
+    ones are missing or stale
+
+    Parameters
+    ----------
+    client : logged in client
+        myfitnesspal.Client
+    start_date, end_date : first and last day
+        datetime.date
+
+    Yields
+    ------
+    (datetime.date, dict of totals, see serialize_totals), in date order
+    """
+
+    username = client.effective_username
+    entries = load_entries(username, start_date, end_date)
+    now = timezone.now()
+    dates = date_range(start_date, end_date)
+    stale = [
+        date
+        for date in dates
+        if date not in entries
+        or not is_fresh(date, entries[date].totals_fetched_at, now)
+    ]
+
+    fetched = fetch_dates(client, stale)
+    stale = set(stale)
+    try:
+        for date in dates:
+            if date in stale:
+                _, day = next(fetched)
+                entry, _ = MFPCacheEntry.objects.update_or_create(
+                    username=username,
+                    date=date,
+                    defaults={
+                        "totals": serialize_totals(day.totals),
+                        "totals_fetched_at": timezone.now(),
+                    },
+                )
+            else:
+                entry = entries[date]
+            yield date, entry.totals
+    finally:
+        fetched.close()
+
+
+def get_weights(client, start_date, end_date):
+    """
+    Weights logged in a date range, fetched from MyFitnessPal only if the cached ones are
+    missing or stale
+
+    Returns
+    -------
+    dict of {datetime.date: Weight}
+    """
+
+    username = client.effective_username
+    entries = load_entries(username, start_date, end_date)
+    now = timezone.now()
+    stale = [
+        date
+        for date in date_range(start_date, end_date)
+        if date not in entries
+        or not is_fresh(date, entries[date].weight_fetched_at, now)
+    ]
+
+    if stale:
+        # Measurements come in pages covering a range, refetch all days between the
+        # first and last stale one
+        weights_raw = with_retries(
+            lambda: client.get_measurements("Weight", stale[0], stale[-1])
+        )
+        if client.user_metadata["unit_preferences"]["weight"] == "pounds":
+            grams = Weight(lb=1).g
+        else:
+            grams = Weight(kg=1).g
+
+        created, updated = [], []
+        for date in date_range(stale[0], stale[-1]):
+            entry = entries.get(date)
+            if entry is None:
+                entry = entries[date] = MFPCacheEntry(username=username, date=date)
+                created.append(entry)
+            else:
+                updated.append(entry)
+            value = weights_raw.get(date)
+            entry.weight = value * grams if value is not None else None
+            entry.weight_fetched_at = now
+            entry.updated_at = now  # bulk_update bypasses auto_now
+        # Another import of the same MFP user may have just cached them too
+        MFPCacheEntry.objects.bulk_create(created, ignore_conflicts=True)
+        MFPCacheEntry.objects.bulk_update(
+            updated, ["weight", "weight_fetched_at", "updated_at"]
+        )
+
+    return {
+        date: Weight(g=entry.weight)
+        for date, entry in sorted(entries.items())
+        if entry.weight is not None
+    }
@@ -0,0 +1,288 @@
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import myfitnesspal
+
+# Columns of the synthetic diaries, as MyFitnessPal names them
+NUTRIENTS = ["Calories", "Carbs", "Fat", "Protein", "Sodium", "Sugar"]
+MEALS = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+# Measurements listed per page, like MyFitnessPal
+MEASUREMENTS_PER_PAGE = 20
+
+
+class FakeMFPServer:
+    """
+    A local stand-in for the MyFitnessPal website, serving synthetic diaries and weights
+    to a myfitnesspal.Client, see client()
+
+    Every day of the last history_days days (up to today) has a diary and most of them a
+    weight, both derived from the date so they are the same on every run. Each request
+    is answered after latency seconds, give or take half of it, and a share error_rate of
+    the diary and measurement requests has its connection dropped, which the client sees
+    as a ConnectionError. Logging in never fails, myfitnesspal does not retry it.
+    While session_expired is set, diaries and measurements redirect to the login page
+    until the client logs in again.
+
+    Parameters
+    ----------
+    history_days : number of days with data
+        int
+    latency : average seconds per request
+        float
+    error_rate : share of requests failing, from 0 to 1
+        float
+    username, password : the only account that can log in
+        string
+    weight_units : "kilograms" or "pounds"
+        string
+    """
+
+    def __init__(
+        self,
+        history_days=365,
+        latency=0.0,
+        error_rate=0.0,
+        username="mfpuser",
+        password="password",
+        weight_units="kilograms",
+    ):
+        self.history_days = history_days
+        self.latency = latency
+        self.error_rate = error_rate
+        self.username = username
+        self.password = password
+        self.weight_units = weight_units
+        self.session_expired = False
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed_requests = 0
+        self.httpd = None
+
+    @property
+    def url(self):
+        return "http://%s:%d/" % self.httpd.server_address[:2]
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeMFPHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, password=None):
+        """
+        Returns a myfitnesspal.Client logged in to this server
+        """
+
+        client = myfitnesspal.Client(
+            self.username,
+            password=password or self.password,
+            login=False,
+            unit_aware=True,
+        )
+        client.BASE_URL = client.BASE_URL_SECURE = client.BASE_API_URL = self.url
+        client._login()
+        return client
+
+    def has_data(self, day):
+        return 0 <= (date.today() - day).days < self.history_days
+
+    def diary(self, day):
+        """
+        The synthetic diary of day
+
+        Returns
+        -------
+        dict of {meal name: list of (food name, list of nutrient values)}
+        """
+
+        if not self.has_data(day):
+            return {}
+        rng = random.Random(day.toordinal())
+        return {
+            meal: [
+                (
+                    "Food %d" % i,
+                    [
+                        rng.randint(50, 600),
+                        rng.randint(0, 80),
+                        rng.randint(0, 30),
+                        rng.randint(0, 40),
+                        rng.randint(0, 900),
+                        rng.randint(0, 30),
+                    ],
+                )
+                for i in range(rng.randint(1, 3))
+            ]
+            for meal in MEALS
+        }
+
+    def calories(self, day):
+        """
+        The total calories of the diary of day, None if it is empty
+        """
+
+        entries = [entry for meal in self.diary(day).values() for entry in meal]
+        return sum(values[0] for _, values in entries) if entries else None
+
+    def weight(self, day):
+        """
+        The weight logged on day, in weight_units, or None
+        """
+
+        if not self.has_data(day):
+            return None
+        rng = random.Random(-day.toordinal())
+        if rng.random() < 0.2:
+            return None
+        return round(80 + 5 * ((day.toordinal() % 90) / 90) + rng.uniform(-0.5, 0.5), 1)
+
+
+class FakeMFPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.body = parse_qs(self.rfile.read(length).decode())
+        self.handle_request()
+
+    def handle_request(self):
+        fake = self.fake
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        with fake.lock:
+            fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency * random.uniform(0.5, 1.5))
+        if self.fails(url.path):
+            with fake.lock:
+                fake.failed_requests += 1
+            # Dropped without a response
+            self.close_connection = True
+            return
+
+        if url.path == "/account/login":
+            if self.command == "POST":
+                self.login()
+            else:
+                self.send_html(
+                    '<form><input name="utf8" value="&#x2713;">'
+                    '<input name="authenticity_token" value="token"></form>'
+                )
+        elif fake.session_expired:
+            self.send_response(302)
+            self.send_header("Location", "/account/login")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif url.path == "/user/auth_token":
+            self.send_json(
+                {
+                    "access_token": "access-token",
+                    "expires_in": 3600,
+                    "token_type": "Bearer",
+                    "user_id": "1",
+                }
+            )
+        elif url.path == "/v2/users/1":
+            self.send_json(
+                {
+                    "item": {
+                        "username": fake.username,
+                        "unit_preferences": {"weight": fake.weight_units},
+                    }
+                }
+            )
+        elif url.path == "/food/diary/%s" % fake.username:
+            self.send_diary(date.fromisoformat(query["date"]))
+        elif url.path == "/measurements/edit":
+            self.send_measurements(int(query.get("page", 1)))
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def fails(self, path):
+        """
+        Whether to drop a diary or measurements request, a share error_rate of them
+        """
+
+        data_paths = ("/food/diary/%s" % self.fake.username, "/measurements/edit")
+        return path in data_paths and random.random() < self.fake.error_rate
+
+    def login(self):
+        if self.body.get("password") == [self.fake.password]:
+            self.fake.session_expired = False
+            self.send_html("<p>Welcome</p>")
+        else:
+            self.send_html("<p>Incorrect username or password</p>")
+
+    def send_diary(self, day):
+        header = "".join("<td>%s</td>" % name for name in NUTRIENTS)
+        rows = []
+        for meal, entries in self.fake.diary(day).items():
+            rows.append('<tr class="meal_header"><td>%s</td>%s</tr>' % (meal, header))
+            for name, values in entries:
+                rows.append(
+                    "<tr><td><a>%s</a></td>%s</tr>"
+                    % (name, "".join("<td>%d</td>" % value for value in values))
+                )
+            rows.append('<tr class="bottom"><td></td></tr>')
+        self.send_html("<table>%s</table>" % "".join(rows))
+
+    def send_measurements(self, page):
+        # Newest first, like MyFitnessPal
+        days = [date.today() - timedelta(days=i) for i in range(self.fake.history_days)]
+        weights = [(day, self.fake.weight(day)) for day in days]
+        weights = [(day, weight) for day, weight in weights if weight is not None]
+        first = (page - 1) * MEASUREMENTS_PER_PAGE
+        rows = (
+            "".join(
+                "<tr><td></td><td>%s</td><td>%s</td></tr>"
+                % (day.strftime("%m/%d/%Y"), weight)
+                for day, weight in weights[first : first + MEASUREMENTS_PER_PAGE]
+            )
+            or '<tr><td colspan="3">No entries</td></tr>'
+        )
+        self.send_html(
+            '<select id="type"><option value="1">Weight</option></select>'
+            '<table class="check-in"><tbody>%s</tbody></table>' % rows
+        )
+
+    def send_html(self, body):
+        self.send_body("<html><body>%s</body></html>" % body, "text/html")
+
+    def send_json(self, data):
+        self.send_body(json.dumps(data), "application/json")
+
+    def send_body(self, body, content_type):
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "%s; charset=utf-8" % content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,142 @@
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import myfitnesspal
+import requests
+from django.conf import settings
+from myfitnesspal.exceptions import MyfitnesspalRequestFailed
+from requests.adapters import HTTPAdapter
+
+from . import mfp_throttle
+
+logger = logging.getLogger("PrimaryLogger")
+
+# Errors worth another try, anything else is a bug or a response we cannot read
+RETRY_EXCEPTIONS = (requests.RequestException, MyfitnesspalRequestFailed)
+
+
+def login(credentials):
+    """
+    Returns a logged in client for MFPCredentials, raises
+    myfitnesspal.exceptions.MyfitnesspalLoginError if they are wrong
+    """
+
+    return pool_connections(
+        myfitnesspal.Client(
+            username=credentials.username,
+            password=credentials.password,
+            unit_aware=True,
+        )
+    )
+
+
+def pool_connections(client):
+    """
+    Mounts a connection pool large enough for settings.MFP_FETCH_CONCURRENCY requests in
+    flight on a new client, otherwise requests discards the connections above its default
+    pool size after each use. Returns the client.
+    """
+
+    adapter = HTTPAdapter(
+        pool_maxsize=max(
+            settings.MFP_FETCH_CONCURRENCY, requests.adapters.DEFAULT_POOLSIZE
+        )
+    )
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    return client
+
+
+def with_retries(function, retries=None, backoff=None):
+    """
+    Calls function until it does not raise one of RETRY_EXCEPTIONS, at most retries + 1
+    times. Waits backoff seconds before the first retry and doubles the wait after each,
+    with some jitter so parallel requests do not retry in lockstep.
+
+    Each call goes through the shared rate limiter and circuit breaker in mfp_throttle,
+    raises mfp_throttle.CircuitOpenError while the breaker is open.
+    """
+
+    retries = settings.MFP_FETCH_RETRIES if retries is None else retries
+    backoff = settings.MFP_FETCH_BACKOFF if backoff is None else backoff
+    for attempt in range(retries + 1):
+        trial = mfp_throttle.before_request()
+        try:
+            result = function()
+        except RETRY_EXCEPTIONS:
+            mfp_throttle.record_failure(trial)
+            if attempt == retries:
+                raise
+            wait = backoff * 2**attempt * random.uniform(0.5, 1.5)
+            logger.warning("MyFitnessPal request failed, retrying in %.1fs", wait)
+            time.sleep(wait)
+        except Exception:
+            # Not a sign of MFP's health either way, let the next request be the trial
+            mfp_throttle.release_trial(trial)
+            raise
+        else:
+            mfp_throttle.record_success(trial)
+            return result
+
+
+def date_range(start_date, end_date):
+    return [
+        start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)
+    ]
+
+
+def fetch_days(client, start_date, end_date, concurrency=None, retries=None):
+    """
+    Fetches the diary days of a date range from MyFitnessPal, see fetch_dates
+    """
+
+    return fetch_dates(client, date_range(start_date, end_date), concurrency, retries)
+
+
+def fetch_dates(client, dates, concurrency=None, retries=None):
+    """
+    Fetches the diary days of dates from MyFitnessPal, up to concurrency at a time
+
+    Parameters
+    ----------
+    client : logged in client, its connection pool sized by pool_connections
+        myfitnesspal.Client
+    dates : days to fetch
+        iterable of datetime.date
+    concurrency : maximum number of requests in flight, settings.MFP_FETCH_CONCURRENCY
+        by default
+        int
+    retries : retries of a failed request, settings.MFP_FETCH_RETRIES by default
+        int
+
+    Yields
+    ------
+    (datetime.date, myfitnesspal day), in the order of dates as soon as each day and the
+        ones before it were fetched. At most 2 * concurrency days are held at a time
+    """
+
+    concurrency = concurrency or settings.MFP_FETCH_CONCURRENCY
+
+    def fetch(date):
+        return with_retries(lambda: client.get_date(date), retries)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = deque()
+    try:
+        for date in dates:
+            pending.append((date, executor.submit(fetch, date)))
+            if len(pending) >= 2 * concurrency:
+                date, future = pending.popleft()
+                yield date, future.result()
+        while pending:
+            date, future = pending.popleft()
+            yield date, future.result()
+    finally:
+        # Don't start the rest if a day failed or the caller stopped early
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,218 @@
+import logging
+import pickle
+import threading
+import time
+
+import myfitnesspal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signing import BadSignature
+from django_cryptography.utils.crypto import FernetBytes, InvalidToken
+
+from .mfp_fetch import login, pool_connections
+
+logger = logging.getLogger("PrimaryLogger")
+
+
+class SessionExpiredError(Exception):
+    """
+    MyFitnessPal no longer accepts the session of a client, see with_session
+    """
+
+
+def session_key(user_id):
+    return "calorietracker:mfp-session:%d" % user_id
+
+
+def check_logged_in(response, *args, **kwargs):
+    """
+    Response hook of pooled clients. A client whose session ended is answered with 401 or
+    redirected to the login page, which myfitnesspal would parse as an empty diary.
+    """
+
+    if response.status_code == 401 or (
+        response.is_redirect
+        and myfitnesspal.Client.LOGIN_PATH in response.headers["Location"]
+    ):
+        raise SessionExpiredError(
+            "MyFitnessPal session expired: %s %s"
+            % (response.status_code, response.request.url)
+        )
+
+
+def expires_at(auth_data, logged_in_at):
+    lifetime = settings.MFP_SESSION_MAX_AGE
+    expires_in = (auth_data or {}).get("expires_in")
+    if expires_in:
+        lifetime = min(lifetime, expires_in)
+    return logged_in_at + lifetime
+
+
+class SessionPool:
+    """
+    Logged in MyFitnessPal clients of each user, so imports and syncs do not log in again
+
+    A client is reused until it was idle for settings.MFP_SESSION_IDLE_TIMEOUT seconds or
+    its login is older than its access token, at most settings.MFP_SESSION_MAX_AGE
+    seconds. Its cookies and tokens, never the password, are also kept in the cache so
+    other processes can restore the session instead of logging in. They are encrypted
+    with the key of the encrypted model fields, like MFPCredentials.password.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {user_id: (username, client, logged_in_at, last_used)}
+        self.clients = {}
+        # One login per user at a time
+        self.user_locks = {}
+
+    def get(self, credentials):
+        """
+        Returns a logged in client for MFPCredentials, logging in only if no session of
+        its user is still valid. Raises myfitnesspal.exceptions.MyfitnesspalLoginError
+        like mfp_fetch.login.
+        """
+
+        with self.lock:
+            self.evict_idle()
+            user_lock = self.user_locks.setdefault(
+                credentials.user_id, threading.Lock()
+            )
+
+        with user_lock:
+            client = self.reuse(credentials) or self.restore(credentials)
+            if client is None:
+                client = login(credentials)
+                self.put(credentials, client)
+            return client
+
+    def put(self, credentials, client):
+        """
+        Adds a client that just logged in with credentials
+        """
+
+        client.session.hooks["response"].append(check_logged_in)
+        logged_in_at = time.time()
+        with self.lock:
+            self.clients[credentials.user_id] = (
+                credentials.username,
+                client,
+                logged_in_at,
+                logged_in_at,
+            )
+        state = {
+            "username": credentials.username,
+            "cookies": client.session.cookies,
+            "auth_data": client._auth_data,
+            "user_metadata": client._user_metadata,
+            "logged_in_at": logged_in_at,
+        }
+        cache.set(
+            session_key(credentials.user_id),
+            FernetBytes().encrypt(pickle.dumps(state)),
+            settings.MFP_SESSION_IDLE_TIMEOUT,
+        )
+
+    def reuse(self, credentials):
+        with self.lock:
+            entry = self.clients.get(credentials.user_id)
+            if entry is None:
+                return None
+            username, client, logged_in_at, _ = entry
+            if (
+                username != credentials.username
+                or expires_at(client._auth_data, logged_in_at) <= time.time()
+            ):
+                del self.clients[credentials.user_id]
+                return None
+            self.clients[credentials.user_id] = (
+                username,
+                client,
+                logged_in_at,
+                time.time(),
+            )
+        cache.touch(session_key(credentials.user_id), settings.MFP_SESSION_IDLE_TIMEOUT)
+        return client
+
+    def discard(self, credentials):
+        """
+        Forgets the session of credentials, the next get logs in again
+        """
+
+        with self.lock:
+            self.clients.pop(credentials.user_id, None)
+        cache.delete(session_key(credentials.user_id))
+
+    def restore(self, credentials):
+        encrypted = cache.get(session_key(credentials.user_id))
+        if not isinstance(encrypted, bytes):
+            # None, or cached in plaintext by an older version
+            return None
+        try:
+            state = pickle.loads(FernetBytes().decrypt(encrypted))
+        except (BadSignature, InvalidToken):
+            # Encrypted with another key
+            return None
+        if (
+            state["username"] != credentials.username
+            or expires_at(state["auth_data"], state["logged_in_at"]) <= time.time()
+        ):
+            return None
+
+        # The password is only needed to log in again, which a restored client never does
+        client = pool_connections(
+            myfitnesspal.Client(
+                credentials.username, password="", login=False, unit_aware=True
+            )
+        )
+        client.session.hooks["response"].append(check_logged_in)
+        client.session.cookies.update(state["cookies"])
+        client._auth_data = state["auth_data"]
+        client._user_metadata = state["user_metadata"]
+        with self.lock:
+            self.clients[credentials.user_id] = (
+                credentials.username,
+                client,
+                state["logged_in_at"],
+                time.time(),
+            )
+        return client
+
+    def evict_idle(self):
+        now = time.time()
+        for user_id, (_, client, logged_in_at, last_used) in list(self.clients.items()):
+            if (
+                expires_at(client._auth_data, logged_in_at) <= now
+                or now - last_used >= settings.MFP_SESSION_IDLE_TIMEOUT
+            ):
+                # Not closed, an import may still be using it
+                del self.clients[user_id]
+
+
+pool = SessionPool()
+
+
+def get_client(credentials):
+    return pool.get(credentials)
+
+
+def with_session(credentials, function):
+    """
+    Calls function with the pooled client of credentials. If MyFitnessPal ended the
+    session meanwhile, the session is discarded and function is called once more with a
+    client that logged in again.
+
+    Returns
+    -------
+    what function returns
+    """
+
+    try:
+        return function(get_client(credentials))
+    except SessionExpiredError:
+        logger.warning(
+            "MyFitnessPal session of user %d expired, logging in again",
+            credentials.user_id,
+        )
+        pool.discard(credentials)
+        return function(get_client(credentials))
@@ -0,0 +1,104 @@
+from contextlib import closing
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+
+from . import snapshots
+from .importer import merge_logs
+from .mfp_cache import get_weights, iter_day_totals
+from .mfp_fetch import date_range
+from .mfp_sessions import with_session
+
+# Fetched MyFitnessPal days merged at a time
+SYNC_CHUNK_DAYS = 30
+
+
+def sync_range(credentials, today=None):
+    """
+    The days the next sync of credentials covers
+
+    A user never synced gets the last settings.MFP_SYNC_INITIAL_DAYS days. Afterwards each
+    sync starts settings.MFP_SYNC_OVERLAP_DAYS before the last synced day, since recent
+    diaries are often completed or corrected a few days late. Those corrections only
+    reach logs that already exist if credentials.sync_overwrite is set.
+
+    Returns
+    -------
+    (datetime.date, datetime.date)
+        first and last day, the first is after the last if there is nothing to sync
+    """
+
+    today = today or date.today()
+    if credentials.last_synced_date is None:
+        start_date = today - timedelta(days=settings.MFP_SYNC_INITIAL_DAYS - 1)
+    else:
+        start_date = credentials.last_synced_date - timedelta(
+            days=settings.MFP_SYNC_OVERLAP_DAYS
+        )
+    return start_date, today
+
+
+def sync_user(credentials, today=None, client=None):
+    """
+    Imports the weights and caloric intake logged on MyFitnessPal since the last sync and
+    moves the watermark to today
+
+    Only the values credentials.sync_weights and sync_calories_in select are imported.
+    Days without a log get a new one, existing logs are left alone unless
+    credentials.sync_overwrite is set, so logs entered by hand survive the sync.
+
+    Parameters
+    ----------
+    credentials : MFPCredentials
+    today : last day to sync
+        datetime.date
+    client : logged in client, the pooled session of credentials by default
+        myfitnesspal.Client
+
+    Returns
+    -------
+    dict
+        number of days synced and of logs created, updated and skipped
+    """
+
+    user = credentials.user
+    start_date, end_date = sync_range(credentials, today)
+    counts = {"days": 0, "created": 0, "updated": 0, "skipped": 0}
+    if start_date > end_date:
+        return counts
+    if client is None:
+        # Syncs again with a new login if the pooled session turns out to be expired
+        return with_session(
+            credentials, lambda client: sync_user(credentials, today, client)
+        )
+
+    weights = {}
+    if credentials.sync_weights:
+        weights = get_weights(client, start_date, end_date)
+    if credentials.sync_calories_in:
+        days = iter_day_totals(client, start_date, end_date)
+    else:
+        days = ((day, {}) for day in date_range(start_date, end_date))
+    with closing(days), snapshots.defer_refresh(user):
+        while True:
+            chunk = list(islice(days, SYNC_CHUNK_DAYS))
+            if not chunk:
+                break
+            calories_in = {
+                day: round(totals["calories"])
+                for day, totals in chunk
+                if "calories" in totals
+            }
+            chunk_weights = {day: weights[day] for day, _ in chunk if day in weights}
+            merged = merge_logs(
+                user, credentials.sync_overwrite, chunk_weights, calories_in
+            )
+            for key in ["created", "updated", "skipped"]:
+                counts[key] += merged[key]
+
+    counts["days"] = (end_date - start_date).days + 1
+    # Only moved once everything was merged, a failed sync is retried from the same day
+    credentials.last_synced_date = end_date
+    credentials.save(update_fields=["last_synced_date", "updated_at"])
+    return counts
@@ -0,0 +1,182 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+logger = logging.getLogger("PrimaryLogger")
+
+# Counters are shared through the cache, so every process and thread calling
+# MyFitnessPal is limited together. They rely on cache.incr being atomic, which it is
+# on memcached and redis, and on the LocMemCache within a single process only. The
+# DatabaseCache and FileBasedCache lose concurrent increments, see check_cache_backend
+KEY_PREFIX = "calorietracker:mfp-throttle:"
+ATOMIC_INCR_BACKENDS = ("locmem", "memcached", "redis")
+
+
+class CircuitOpenError(Exception):
+    """
+    MyFitnessPal failed too often recently, requests are not sent until it cooled down
+    """
+
+
+@checks.register(checks.Tags.caches)
+def check_cache_backend(app_configs, **kwargs):
+    backend = settings.CACHES["default"]["BACKEND"]
+    if any(name in backend.lower() for name in ATOMIC_INCR_BACKENDS):
+        return []
+    return [
+        checks.Warning(
+            "The MyFitnessPal rate limiter and circuit breaker count requests with "
+            "cache.incr, which %s does not increment atomically" % backend,
+            hint="Use a memcached or redis cache backend",
+            id="calorietracker.W001",
+        )
+    ]
+
+
+def counter(key, timeout):
+    """
+    Increments the counter at key, created with timeout, and returns its new value
+    """
+
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Expired in between
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def wait_for_token():
+    """
+    Blocks until the request may be sent, at most settings.MFP_RATE_LIMIT per second
+
+    A fixed window counter: the requests of each second are counted, once
+    MFP_RATE_LIMIT were sent the rest wait for the next second. A limit of 0 disables
+    it.
+    """
+
+    limit = settings.MFP_RATE_LIMIT
+    while limit:
+        now = time.time()
+        second = int(now)
+        if counter(KEY_PREFIX + "second:%d" % second, 5) <= limit:
+            break
+        counter(KEY_PREFIX + "throttled:%d" % (second // 60), 180)
+        # Jitter so the waiting requests do not all arrive at the start of the second
+        time.sleep(second + 1 - now + random.uniform(0, 0.1))
+    counter(KEY_PREFIX + "requests:%d" % (time.time() // 60), 180)
+
+
+def before_request():
+    """
+    Checks the circuit breaker and waits for the rate limiter, call before each request
+
+    Returns
+    -------
+    bool
+        True if the request is the trial of a breaker that cooled down, pass it on to
+        record_success, record_failure or release_trial
+
+    Raises
+    ------
+    CircuitOpenError if the breaker is open
+    """
+
+    trial = False
+    open_until = cache.get(KEY_PREFIX + "open-until")
+    if open_until is not None:
+        # Once cooled down a single request is let through to see if MFP recovered
+        if open_until > time.time() or not cache.add(
+            KEY_PREFIX + "trial", True, settings.MFP_BREAKER_COOLDOWN
+        ):
+            raise CircuitOpenError("MyFitnessPal requests are paused after failures")
+        trial = True
+
+    wait_for_token()
+    return trial
+
+
+def record_success(trial):
+    if trial:
+        logger.info("MyFitnessPal recovered, closing the circuit breaker")
+        cache.delete_many(
+            [KEY_PREFIX + "open-until", KEY_PREFIX + "trial", KEY_PREFIX + "failures"]
+        )
+
+
+def record_failure(trial):
+    """
+    Counts a failed request, settings.MFP_BREAKER_THRESHOLD of them within
+    settings.MFP_BREAKER_WINDOW seconds open the breaker for MFP_BREAKER_COOLDOWN seconds
+    """
+
+    failures = counter(KEY_PREFIX + "failures", settings.MFP_BREAKER_WINDOW)
+    if trial or failures >= settings.MFP_BREAKER_THRESHOLD:
+        logger.warning(
+            "MyFitnessPal requests failed %d times, pausing them for %ds",
+            failures,
+            settings.MFP_BREAKER_COOLDOWN,
+        )
+        cache.set(
+            KEY_PREFIX + "open-until", time.time() + settings.MFP_BREAKER_COOLDOWN, None
+        )
+        cache.delete(KEY_PREFIX + "trial")
+
+
+def release_trial(trial):
+    """
+    Lets another request be the trial, when this one ended in an error that says
+    nothing about whether MyFitnessPal recovered
+    """
+
+    if trial:
+        cache.delete(KEY_PREFIX + "trial")
+
+
+def traffic_status():
+    """
+    The current request rates and breaker state, as reported to staff
+
+    Returns
+    -------
+    dict
+    """
+
+    now = time.time()
+    minute = int(now // 60)
+    counts = cache.get_many(
+        [
+            KEY_PREFIX + "second:%d" % now,
+            KEY_PREFIX + "requests:%d" % (minute - 1),
+            KEY_PREFIX + "throttled:%d" % (minute - 1),
+            KEY_PREFIX + "failures",
+            KEY_PREFIX + "open-until",
+        ]
+    )
+    open_until = counts.get(KEY_PREFIX + "open-until")
+    if open_until is None:
+        state = "closed"
+    elif open_until > now:
+        state = "open"
+    else:
+        state = "half-open"
+
+    return {
+        "state": state,
+        "open_for_seconds": max(0, round(open_until - now)) if open_until else 0,
+        "recent_failures": counts.get(KEY_PREFIX + "failures", 0),
+        "rate_limit": settings.MFP_RATE_LIMIT,
+        "requests_this_second": counts.get(KEY_PREFIX + "second:%d" % now, 0),
+        # Averages over the last full minute
+        "requests_per_second": round(
+            counts.get(KEY_PREFIX + "requests:%d" % (minute - 1), 0) / 60, 2
+        ),
+        "throttled_per_second": round(
+            counts.get(KEY_PREFIX + "throttled:%d" % (minute - 1), 0) / 60, 2
+        ),
+    }
@@ -1,57 +1,36 @@
 from collections import OrderedDict
+from contextlib import closing
 from datetime import date, timedelta
-from threading import Thread
+from itertools import islice
 import myfitnesspal
 
 from django import forms
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import connection
+from django.http import JsonResponse
 from django.shortcuts import redirect
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, FormView, RedirectView, UpdateView
-from measurement.measures import Distance, Mass, Weight
-
-
+from django.urls import reverse, reverse_lazy
+from django.views.generic import (
+    CreateView,
+    FormView,
+    RedirectView,
+    UpdateView,
+    View,
+)
+from measurement.measures import Distance, Mass
+
+from . import jobs, snapshots
 from .forms import ImportMFPForm
-from .models import Log, MFPCredentials
-
-
-def start_new_thread(function):
-    def decorator(*args, **kwargs):
-        t = Thread(target=function, args=args, kwargs=kwargs)
-        t.daemon = True
-        t.start()
+from .importer import merge_logs
+from .mfp_cache import get_weights, iter_day_totals
+from .mfp_fetch import login, with_retries
+from .mfp_throttle import traffic_status
+from .mfp_sessions import pool
+from .models import MFPCredentials
 
-    return decorator
-
-
-@start_new_thread
-def merge_helper(user, form, client):
-    connection.close()
-    if form.cleaned_data["mfp_data_select"] == "Weights":
-        weights_dict = get_weights_by_range(
-            client,
-            form.cleaned_data["mfp_start_date"],
-            form.cleaned_data["mfp_end_date"],
-        )
-        merge_mfp_weights(
-            user=user,
-            overwrite=form.cleaned_data["mfp_overwrite"],
-            weights_dict=weights_dict,
-        )
-    elif form.cleaned_data["mfp_data_select"] == "CI":
-        days_dict = get_days_by_range(
-            client,
-            form.cleaned_data["mfp_start_date"],
-            form.cleaned_data["mfp_end_date"],
-        )
-        merge_mfp_calories_in(
-            user=user,
-            overwrite=form.cleaned_data["mfp_overwrite"],
-            days_dict=days_dict,
-        )
+# Fetched MyFitnessPal days merged at a time
+MFP_CHUNK_DAYS = 30
 
 
 def get_days_by_range(client, start_date, end_date=date.today() - timedelta(days=1)):
@@ -63,19 +42,14 @@ def get_days_by_range(client, start_date, end_date=date.today() - timedelta(days
             datetime.date
         end_day
             datetime.date
-    Returns dict of {date: objects of class day}
-        day: https://github.com/coddingtonbear/python-myfitnesspal/blob/master/myfitnesspal/day.py
+    Returns dict of {date: diary totals}
+        see mfp_cache.serialize_totals
 
+    Days are fetched concurrently and cached, use mfp_cache.iter_day_totals to process
+    them as they arrive
     """
 
-    delta = timedelta(days=1)
-    output = {}
-    while start_date <= end_date:
-        data = client.get_date(start_date)
-        output[start_date] = data
-        start_date += delta
-
-    return output
+    return dict(iter_day_totals(client, start_date, end_date))
 
 
 def get_weights_by_range(client, start_date, end_date=date.today() - timedelta(days=1)):
@@ -87,17 +61,12 @@ def get_weights_by_range(client, start_date, end_date=date.today() - timedelta(d
             datetime.date
         end_day
             datetime.date
-    Returns OrderedDict of weights
-        {date: measurement}
+    Returns dict of weights
+        {date: Weight}
 
     """
-    weights_raw = client.get_measurements("Weight", start_date, end_date)
-    if client.user_metadata["unit_preferences"]["weight"] == "pounds":
-        weights = {k: Weight(lb=v) for k, v in weights_raw.items()}
-    else:
-        weights = {k: Weight(kg=v) for k, v in weights_raw.items()}
 
-    return weights
+    return get_weights(client, start_date, end_date)
 
 
 def get_weight_by_date(client, date):
@@ -118,7 +87,7 @@ def get_day_by_date(client, date):
         https://github.com/coddingtonbear/python-myfitnesspal/blob/master/myfitnesspal/day.py
     """
 
-    day = client.get_date(date)
+    day = with_retries(lambda: client.get_date(date))
     return day
 
 
@@ -133,21 +102,7 @@ def merge_mfp_weights(user, overwrite, weights_dict):
         ordered dict of date: weight
     """
 
-    for date, weight in weights_dict.items():
-        # print(date, weight)
-        # print("Resolving date", date, "weight:", weight)
-
-        if Log.objects.filter(user=user).filter(date=date):
-            if overwrite:
-                Log.objects.filter(user=user).filter(date=date).update(weight=weight)
-                # print("Overwrite is True! Updated Weight")
-        else:
-            # print("no data for date", date, "exists. Creating a new entry")
-            Log.objects.create(
-                user=user, date=date, weight=weight, calories_in=0
-            )  # Note we have calories_in as null=False so we place 0 and assume the user can import calories separately
-
-    return True
+    return merge_logs(user, overwrite, weights=weights_dict)
 
 
 def merge_mfp_calories_in(user, overwrite, days_dict):
@@ -158,31 +113,86 @@ def merge_mfp_calories_in(user, overwrite, days_dict):
     overwrite: Overwrite logged weights if True
         bool
     days_dict
-        dict of {date: objects of class day}
+        dict of {date: diary totals}, see get_days_by_range
     """
 
-    for date, day in days_dict.items():
-        calories_in = day.totals["calories"].C
-        # print(date, calories_in)
-        # print("Resolving date", date, "calories_in:", calories_in)
-
-        if Log.objects.filter(user=user).filter(date=date):
-            if overwrite:
-                Log.objects.filter(user=user).filter(date=date).update(
-                    calories_in=calories_in
-                )
-                # print("Overwrite is True! Updated calories_in")
-        else:
-            # print("no data for date", date, "exists. Creating a new entry")
-            Log.objects.create(
-                user=user, date=date, weight=Weight(lb=0.0), calories_in=calories_in
-            )  # Note we have weight as null=False so we place 0 and assume the user can import weights separately
+    # Days without any diary entries have no totals
+    calories_in = {
+        date: round(totals["calories"])
+        for date, totals in days_dict.items()
+        if "calories" in totals
+    }
+    return merge_logs(user, overwrite, calories_in=calories_in)
+
+
+def import_mfp(
+    user,
+    client,
+    data_select,
+    overwrite,
+    start_date,
+    end_date,
+    progress=lambda **fields: None,
+):
+    """
+    Imports the weights or caloric intake logged on MyFitnessPal in a date range
+
+    Diary days are merged MFP_CHUNK_DAYS at a time while the following ones are still
+    being fetched, all weights come from a few paginated requests.
+
+    Parameters
+    ----------
+    user : django user class
+    client : logged in client
+        myfitnesspal.Client
+    data_select : "Weights" or "CI", see ImportMFPForm
+        string
+    overwrite : overwrite logged values with imported ones if True
+        bool
+    start_date, end_date : first and last day
+        datetime.date
+    progress : called with the number of days processed and logs created and updated
+        so far, e.g. to update an ImportJob
+        function
+
+    Returns
+    -------
+    dict
+        number of logs created and updated
+    """
 
-    return True
+    if data_select == "Weights":
+        counts = merge_mfp_weights(
+            user, overwrite, get_weights_by_range(client, start_date, end_date)
+        )
+        progress(
+            rows_processed=(end_date - start_date).days + 1,
+            logs_created=counts["created"],
+            logs_updated=counts["updated"],
+        )
+        return {"created": counts["created"], "updated": counts["updated"]}
+
+    totals = {"created": 0, "updated": 0}
+    processed = 0
+    days = iter_day_totals(client, start_date, end_date)
+    with closing(days), snapshots.defer_refresh(user):
+        while True:
+            chunk = dict(islice(days, MFP_CHUNK_DAYS))
+            if not chunk:
+                break
+            counts = merge_mfp_calories_in(user, overwrite, chunk)
+            processed += len(chunk)
+            totals["created"] += counts["created"]
+            totals["updated"] += counts["updated"]
+            progress(
+                rows_processed=processed,
+                logs_created=totals["created"],
+                logs_updated=totals["updated"],
+            )
+    return totals
 
 
 class ImportMFPCredentials(RedirectView):
-
     """
     Redirects either to create or updateview
     """
@@ -215,6 +225,9 @@ class ImportMFPCredentialsCreate(LoginRequiredMixin, CreateView):
     fields = (
         "username",
         "password",
+        "sync_weights",
+        "sync_calories_in",
+        "sync_overwrite",
     )
 
     success_url = reverse_lazy("importmfp")
@@ -228,11 +241,7 @@ class ImportMFPCredentialsCreate(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.user = self.request.user
         try:
-            client = myfitnesspal.Client(
-                username=form.cleaned_data["username"],
-                password=form.cleaned_data["password"],
-                unit_aware=True,
-            )
+            client = login(form.instance)
 
         except myfitnesspal.exceptions.MyfitnesspalLoginError:
             messages.info(
@@ -242,7 +251,10 @@ class ImportMFPCredentialsCreate(LoginRequiredMixin, CreateView):
             return super().form_invalid(form)
 
         messages.success(self.request, "MyFitnessPal Credentials Saved")
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Imports reuse this session instead of logging in again
+        pool.put(self.object, client)
+        return response
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
@@ -259,6 +271,9 @@ class ImportMFPCredentialsUpdate(LoginRequiredMixin, UpdateView):
     fields = (
         "username",
         "password",
+        "sync_weights",
+        "sync_calories_in",
+        "sync_overwrite",
     )
 
     success_url = reverse_lazy("importmfp")
@@ -272,11 +287,7 @@ class ImportMFPCredentialsUpdate(LoginRequiredMixin, UpdateView):
     def form_valid(self, form):
         form.instance.user = self.request.user
         try:
-            client = myfitnesspal.Client(
-                username=form.cleaned_data["username"],
-                password=form.cleaned_data["password"],
-                unit_aware=True,
-            )
+            client = login(form.instance)
 
         except myfitnesspal.exceptions.MyfitnesspalLoginError:
             messages.info(
@@ -286,7 +297,10 @@ class ImportMFPCredentialsUpdate(LoginRequiredMixin, UpdateView):
             return super().form_invalid(form)
 
         messages.success(self.request, "MyFitnessPal Credentials Updated")
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Imports reuse this session instead of logging in again
+        pool.put(self.object, client)
+        return response
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
@@ -300,7 +314,6 @@ class ImportMFPCredentialsUpdate(LoginRequiredMixin, UpdateView):
 class ImportMFP(FormView):
     template_name = "calorietracker/importMFPdata.html"
     form_class = ImportMFPForm
-    success_url = reverse_lazy("logs")
 
     def dispatch(self, request):
 
@@ -323,22 +336,25 @@ class ImportMFP(FormView):
             # todo: potentially this needs a lot of api response handling back to the user
             # todo: create a loading animation/page on form submission so that user does not spam click submit
 
-            try:
-                client = myfitnesspal.Client(
-                    username=self.request.user.mfpcredentials.username,
-                    password=self.request.user.mfpcredentials.password,
-                    unit_aware=True,
-                )
-            except myfitnesspal.exceptions.MyfitnesspalLoginError:
-                messages.info(
-                    self.request,
-                    "Error connecting to MyFitnessPal with the provided information. Please check your MyFitnessPal account settings and try again.",
-                )
-                return redirect(reverse_lazy("import-credentials-mfp"))
-            merge_helper(user=self.request.user, form=form, client=client)
+            self.job = jobs.enqueue_mfp(self.request.user, form.cleaned_data)
             messages.info(
                 self.request,
                 "Importing! For large imports, this may take some time. Thank you for your patience!",
             )
 
             return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse("import-job", args=[self.job.pk])
+
+
+class MFPTraffic(UserPassesTestMixin, View):
+    """
+    Rates and circuit breaker state of the requests to MyFitnessPal, for staff
+    """
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        return JsonResponse(traffic_status())
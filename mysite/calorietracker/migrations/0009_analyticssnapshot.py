@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('calorietracker', '0008_wallet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('dates', models.JSONField(default=list)),
+                ('raw_weights', models.JSONField(default=list)),
+                ('weights', models.JSONField(default=list)),
+                ('weights_kg', models.JSONField(default=list)),
+                ('calories_in', models.JSONField(default=list)),
+                ('summaries', models.JSONField(default=dict)),
+                ('weekly', models.JSONField(default=dict)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
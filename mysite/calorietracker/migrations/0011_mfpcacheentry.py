@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorietracker', '0010_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MFPCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('username', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('totals', models.JSONField(blank=True, null=True)),
+                ('totals_fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('weight', models.FloatField(blank=True, null=True)),
+                ('weight_fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('username', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorietracker', '0011_mfpcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mfpcredentials',
+            name='last_synced_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
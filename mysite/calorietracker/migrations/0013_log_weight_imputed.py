@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorietracker', '0012_mfpcredentials_last_synced_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='weight_imputed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
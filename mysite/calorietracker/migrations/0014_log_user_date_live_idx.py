@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorietracker', '0013_log_weight_imputed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(condition=models.Q(deleted__isnull=True), fields=['user', 'date', 'weight', 'calories_in', 'weight_imputed', 'deleted'], name='log_user_date_live_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('calorietracker', '0014_log_user_date_live_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('log_id', models.IntegerField()),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='log_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='logtombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='logtombstone',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='logtombstone_user_updated_idx'),
+        ),
+    ]
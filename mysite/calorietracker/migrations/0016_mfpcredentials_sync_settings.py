@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calorietracker', '0015_logtombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mfpcredentials',
+            name='sync_calories_in',
+            field=models.BooleanField(default=True, help_text='Import the calories of your MyFitnessPal diary'),
+        ),
+        migrations.AddField(
+            model_name='mfpcredentials',
+            name='sync_overwrite',
+            field=models.BooleanField(default=False, help_text='Replace the values of days you already logged with the MyFitnessPal ones'),
+        ),
+        migrations.AddField(
+            model_name='mfpcredentials',
+            name='sync_weights',
+            field=models.BooleanField(default=True, help_text='Import your MyFitnessPal weights'),
+        ),
+    ]
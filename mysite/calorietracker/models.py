@@ -24,6 +24,19 @@ class MFPCredentials(DateTimeFields, SafeDeleteModel):
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
     username = models.CharField(max_length=255)
     password = encrypt(models.CharField(max_length=255))
+    # Last day imported by the incremental sync, see mfp_sync.py
+    last_synced_date = models.DateField(null=True, blank=True)
+    # What the sync imports
+    sync_weights = models.BooleanField(
+        default=True, help_text="Import your MyFitnessPal weights"
+    )
+    sync_calories_in = models.BooleanField(
+        default=True, help_text="Import the calories of your MyFitnessPal diary"
+    )
+    sync_overwrite = models.BooleanField(
+        default=False,
+        help_text="Replace the values of days you already logged with the MyFitnessPal ones",
+    )
 
 
 class Feedback(DateTimeFields, SafeDeleteModel):
@@ -186,6 +199,30 @@ class Log(DateTimeFields, SafeDeleteModel):
 
     class Meta:
         unique_together = ("user", "date")
+        indexes = [
+            # The logs of a user by date, as read by LogSeries.from_queryset. The values
+            # are part of the index so those queries never touch the table, and soft
+            # deleted logs are left out where the database supports partial indexes.
+            # deleted is always NULL in it but SQLite only treats an index as covering
+            # if it has every column the query mentions
+            models.Index(
+                fields=[
+                    "user",
+                    "date",
+                    "weight",
+                    "calories_in",
+                    "weight_imputed",
+                    "deleted",
+                ],
+                name="log_user_date_live_idx",
+                condition=models.Q(deleted__isnull=True),
+            ),
+            # The changes since a watermark, in the order logsync_views.LogChanges
+            # pages through them. Soft deleted logs are changes too
+            models.Index(
+                fields=["user", "updated_at", "id"], name="log_user_updated_idx"
+            ),
+        ]
 
     user = models.ForeignKey(
         get_user_model(),
@@ -197,6 +234,8 @@ class Log(DateTimeFields, SafeDeleteModel):
     date = models.DateField(blank=False)  # Log the date
 
     weight = MeasurementField(measurement=Weight, null=True, blank=False)
+    # The weight was not logged but filled in, see imputation.backfill_imputed_weights
+    weight_imputed = models.BooleanField(default=False)
 
     calories_in = models.IntegerField(
         blank=False,
@@ -222,3 +261,118 @@ class Log(DateTimeFields, SafeDeleteModel):
         null=True,
         help_text="Estimate your relative activity level",
     )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        log = super().from_db(db, field_names, values)
+        # An update can move a log to another date, the snapshot is then refreshed from
+        # the earlier one, see signals.refresh_snapshot_on_log_save
+        log._loaded_date = log.__dict__.get("date")
+        return log
+
+
+class LogTombstone(DateTimeFields):
+    """
+    A log that was deleted for good, so clients syncing with
+    logsync_views.LogChanges learn about it. Soft deleted logs are still in the
+    Log table and need none
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "updated_at", "id"],
+                name="logtombstone_user_updated_idx",
+            ),
+        ]
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    log_id = models.IntegerField()
+    date = models.DateField()
+
+
+class AnalyticsSnapshot(DateTimeFields, SafeDeleteModel):
+    """
+    Precomputed analytics for a user's logs so the analytics page does not have to
+    reload and re-smooth their whole history on every view.
+    Kept up to date by the Log signals, see snapshots.refresh_snapshot
+    """
+
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
+
+    # Parallel series ordered by date
+    dates = models.JSONField(default=list)  # date ordinals
+    raw_weights = models.JSONField(default=list)  # weights as logged, in grams
+    weights = models.JSONField(default=list)  # zero weights imputed, in lbs
+    weights_kg = models.JSONField(default=list)  # zero weights imputed, in kgs
+    calories_in = models.JSONField(default=list)
+
+    summaries = models.JSONField(default=dict)  # {range: numbers that only need logs}
+    weekly = models.JSONField(default=dict)  # {unit_preference: weekly table rows}
+
+
+class ImportJob(DateTimeFields, SafeDeleteModel):
+    """
+    A CSV or MyFitnessPal import, run outside the request by the import worker
+    (manage.py run_import_worker), see jobs.py
+    """
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+
+    kind_choices = [
+        ("C", "CSV"),
+        ("M", "MyFitnessPal"),
+    ]
+    kind = models.CharField(max_length=1, choices=kind_choices)
+
+    status_choices = [
+        ("Q", "Queued"),
+        ("R", "Running"),
+        ("D", "Done"),
+        ("F", "Failed"),
+    ]
+    status = models.CharField(max_length=1, choices=status_choices, default="Q")
+
+    options = models.JSONField(default=dict)  # cleaned form data the import runs with
+    data_file = models.FileField(upload_to="imports/", blank=True)  # CSV imports only
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    # Progress
+    rows_total = models.IntegerField(null=True, blank=True)  # rows or days to import
+    rows_processed = models.IntegerField(default=0)
+    logs_created = models.IntegerField(default=0)
+    logs_updated = models.IntegerField(default=0)
+    errors = models.JSONField(default=list)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def throughput(self):
+        """
+        Rows processed per second since the job started
+        """
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at or datetime.datetime.now(datetime.timezone.utc)
+        seconds = (end - self.started_at).total_seconds()
+        return self.rows_processed / seconds if seconds > 0 else 0.0
+
+
+class MFPCacheEntry(DateTimeFields, SafeDeleteModel):
+    """
+    What MyFitnessPal returned for a day of an MFP user, see mfp_cache.py
+    """
+
+    class Meta:
+        unique_together = ("username", "date")
+
+    username = models.CharField(max_length=255)  # the MFP user, not ours
+    date = models.DateField()
+
+    # Diary totals, calories in Calories and nutrients in grams. Null if not fetched
+    totals = models.JSONField(null=True, blank=True)
+    totals_fetched_at = models.DateTimeField(null=True, blank=True)
+
+    # Null if no weight was logged or it was not fetched
+    weight = models.FloatField(null=True, blank=True)  # in grams
+    weight_fetched_at = models.DateTimeField(null=True, blank=True)
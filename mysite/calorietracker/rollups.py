@@ -0,0 +1,54 @@
+from django.db.models import Avg, Count, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+# Weeks are ISO weeks starting on Monday. Both are truncated to a date, so periods of
+# different years never share a key
+PERIODS = {"week": TruncWeek, "month": TruncMonth}
+
+
+def rollup(logs, period):
+    """
+    Aggregates logs per week or month in the database, only one row per period is loaded
+
+    Parameters
+    ----------
+    logs : Log queryset, e.g. Log.objects.filter(user=user)
+    period : "week" or "month"
+        string
+
+    Returns
+    -------
+    list of dict, ordered by period
+        period: first day of the week or month (datetime.date)
+        first_date, last_date: first and last logged date in the period
+        days: number of logs
+        calories_in_total, calories_in_mean: daily caloric intake
+        weight_mean, weight_min, weight_max: of the logged weights in grams.
+            Weights of 0 and imputed ones are not logged weights, None if there are
+            only those
+    """
+
+    logged_weight = Q(weight__gt=0, weight_imputed=False)
+    return list(
+        logs.annotate(period=PERIODS[period]("date"))
+        .values("period")
+        .annotate(
+            first_date=Min("date"),
+            last_date=Max("date"),
+            days=Count("id"),
+            calories_in_total=Sum("calories_in"),
+            calories_in_mean=Avg("calories_in"),
+            weight_mean=Avg("weight", filter=logged_weight, output_field=FloatField()),
+            weight_min=Min("weight", filter=logged_weight, output_field=FloatField()),
+            weight_max=Max("weight", filter=logged_weight, output_field=FloatField()),
+        )
+        .order_by("period")
+    )
+
+
+def weekly(logs):
+    return rollup(logs, "week")
+
+
+def monthly(logs):
+    return rollup(logs, "month")
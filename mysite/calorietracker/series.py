@@ -0,0 +1,84 @@
+import numpy as np
+from django.db.models import Case, F, FloatField, Q, Value, When
+from measurement.measures import Weight
+
+GRAMS_PER_LB = Weight(lb=1).g
+GRAMS_PER_KG = Weight(kg=1).g
+
+
+def logged_weight_g():
+    """
+    The logged weight of a Log in grams, 0 if none was logged. Imputed weights count
+    as not logged, they are imputed again from the logged ones
+    """
+    return Case(
+        When(Q(weight_imputed=True) | Q(weight__isnull=True), then=Value(0.0)),
+        default=F("weight"),
+        output_field=FloatField(),
+    )
+
+
+class LogSeries:
+    """
+    Logs as parallel NumPy arrays ordered by date.
+
+    - ids: Log ids (may be empty if not needed)
+    - dates: dates as day numbers, see date.toordinal()
+    - weights: weights in grams, 0 where no weight was logged or it was imputed
+    - calories_in: daily caloric intake
+    """
+
+    def __init__(self, dates=(), weights=(), calories_in=(), ids=()):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=float)
+        self.calories_in = np.asarray(calories_in, dtype=np.int64)
+
+    @staticmethod
+    def values_queryset(queryset, ids=False):
+        """
+        The rows from_queryset loads, (date, weight in grams, calories_in[, id]) by date
+        """
+        fields = ["date", "weight_g", "calories_in"] + (["id"] if ids else [])
+        return (
+            queryset.annotate(weight_g=logged_weight_g())
+            .order_by("date")
+            .values_list(*fields)
+        )
+
+    @classmethod
+    def from_queryset(cls, queryset, ids=False):
+        """
+        Loads a Log queryset with values_list, skipping the Weight objects django_measurement
+        would otherwise build for every row
+        """
+        rows = list(cls.values_queryset(queryset, ids))
+        columns = list(zip(*rows)) if rows else [()] * (4 if ids else 3)
+        return cls(
+            dates=[day.toordinal() for day in columns[0]],
+            weights=[weight or 0.0 for weight in columns[1]],
+            calories_in=columns[2],
+            ids=columns[3] if ids else (),
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def append(self, other):
+        """
+        Returns a new LogSeries with the entries of other after those of this one
+        """
+        return LogSeries(
+            dates=np.concatenate((self.dates, other.dates)),
+            weights=np.concatenate((self.weights, other.weights)),
+            calories_in=np.concatenate((self.calories_in, other.calories_in)),
+            ids=np.concatenate((self.ids, other.ids)),
+        )
+
+    @property
+    def weights_lb(self):
+        return self.weights / GRAMS_PER_LB
+
+    @property
+    def weights_kg(self):
+        return self.weights / GRAMS_PER_KG
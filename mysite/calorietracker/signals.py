@@ -1,10 +1,15 @@
 from actstream import action
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.signals import user_logged_in
-from django.db.models.signals import post_save
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Setting, Streak
+from . import analytics_cache, snapshots
+from .models import Log, LogTombstone, Setting, Streak
 
 
 @receiver(post_save, sender=get_user_model())
@@ -23,6 +28,69 @@ def create_user_streak_model(sender, instance, created, **kwargs):
         Streak(user=user).save()
 
 
+@receiver(post_save, sender=Log)
+def refresh_snapshot_on_log_save(sender, instance, **kwargs):
+    since = snapshots.to_date(instance.date)
+    # The date the log had when it was loaded, see Log.from_db
+    loaded_date = getattr(instance, "_loaded_date", None)
+    instance._loaded_date = since
+    if loaded_date and loaded_date < since:
+        since = loaded_date
+    snapshots.log_changed(instance.user, since)
+
+
+@receiver(post_delete, sender=Log)
+def refresh_snapshot_on_log_delete(sender, instance, **kwargs):
+    snapshots.log_changed(instance.user, instance.date)
+
+
+@receiver(post_delete, sender=Log)
+def record_log_tombstone(sender, instance, **kwargs):
+    LogTombstone.objects.create(
+        user_id=instance.user_id, log_id=instance.pk, date=instance.date
+    )
+
+
+@receiver(post_delete, sender=get_user_model())
+def delete_user_log_tombstones(sender, instance, **kwargs):
+    # The tombstones of the logs deleted along with the user, created after the
+    # deletion collected the user's rows
+    LogTombstone.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Setting)
+def invalidate_analytics_on_setting_save(sender, instance, **kwargs):
+    analytics_cache.settings_changed(instance.user)
+
+
+@receiver(post_delete, sender=Setting)
+def invalidate_analytics_on_setting_delete(sender, instance, **kwargs):
+    analytics_cache.settings_changed(instance.user)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute("PRAGMA %s = %s" % (pragma, value))
+
+
+@receiver(request_started)
+def close_unusable_connections(sender, **kwargs):
+    # Django 3.1 only checks a persistent connection after an error in its last
+    # request, a connection the server dropped in between fails the next query
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and connection.settings_dict["CONN_MAX_AGE"]
+            and not connection.is_usable()
+        ):
+            connection.close()
+
+
 # @receiver(user_logged_in)
 # def user_logged_in_sample_function(sender, request, user, **kwargs):
 #     print("Example")
@@ -0,0 +1,359 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+
+from . import analytics_cache, rollups
+from .imputation import IMPUTATION_WINDOW, impute_zero_weights
+from .models import AnalyticsSnapshot, Log
+from .series import GRAMS_PER_KG, GRAMS_PER_LB, LogSeries
+from .utilities import moving_average, rolling_TDEE, weight_change
+
+RANGES = ["7", "14", "31", "all"]
+# Logs the fixed ranges need: the longest range and the weights smoothed into its first
+# day, see summarize
+SUMMARY_TAIL = 31 + 5
+
+# Holds {user_id: earliest changed date} while refreshes are deferred, see defer_refresh
+_deferred = threading.local()
+
+
+def to_date(value):
+    """
+    Log.date may still be a string or datetime on an instance that was not reloaded
+    """
+    value = Log._meta.get_field("date").to_python(value)
+    return value.date() if hasattr(value, "date") else value
+
+
+def get_snapshot(user):
+    """
+    Returns the user's AnalyticsSnapshot, building it first if it does not exist yet
+    """
+    try:
+        return AnalyticsSnapshot.objects.get(user=user)
+    except AnalyticsSnapshot.DoesNotExist:
+        return refresh_snapshot(user)
+
+
+def refresh_snapshot(user, since=None, create=True):
+    """
+    Brings the user's AnalyticsSnapshot up to date with their logs.
+
+    Only logs dated on or after since are reloaded and spliced into the stored series.
+    Zero weights are imputed again from shortly before there onwards, and only the
+    weekly table rows and summaries that depend on the changed entries are rebuilt,
+    see weekly_table and summarize.
+
+    Parameters
+    ----------
+    user : django user class
+    since : earliest date that was created, changed or deleted. None rebuilds everything
+        datetime.date
+    create : build the snapshot if the user has none yet, otherwise do nothing
+        bool
+
+    Returns
+    -------
+    AnalyticsSnapshot or None
+    """
+
+    if create:
+        snapshot, created = AnalyticsSnapshot.objects.get_or_create(user=user)
+    else:
+        snapshot = AnalyticsSnapshot.objects.filter(user=user).first()
+        if snapshot is None:
+            return None
+        created = False
+
+    logs = Log.objects.filter(user=user)
+    if created or not snapshot.dates:
+        since = None
+    cut = 0
+    if since is not None:
+        since = to_date(since)
+        cut = bisect_left(snapshot.dates, since.toordinal())
+    tail = LogSeries.from_queryset(
+        logs if since is None else logs.filter(date__gte=since)
+    )
+
+    # Imputation looks back up to IMPUTATION_WINDOW nonzero weights, redo it from there
+    start = imputation_start(snapshot.raw_weights, cut)
+    stored = LogSeries(
+        dates=snapshot.dates[start:cut],
+        weights=snapshot.raw_weights[start:cut],
+        calories_in=snapshot.calories_in[start:cut],
+    ).append(tail)
+    imputed, _ = impute_zero_weights(
+        stored.dates, stored.weights, window=IMPUTATION_WINDOW
+    )
+
+    previous_zero_weights = snapshot.summaries.get("zero_weights", True)
+    previous_zero_calories = snapshot.summaries.get("zero_calories", True)
+    snapshot.dates = snapshot.dates[:cut] + tail.dates.tolist()
+    snapshot.raw_weights = snapshot.raw_weights[:cut] + tail.weights.tolist()
+    snapshot.calories_in = snapshot.calories_in[:cut] + tail.calories_in.tolist()
+    snapshot.weights = snapshot.weights[:start] + [
+        round(weight, 2) for weight in (imputed / GRAMS_PER_LB).tolist()
+    ]
+    snapshot.weights_kg = snapshot.weights_kg[:start] + [
+        round(weight, 2) for weight in (imputed / GRAMS_PER_KG).tolist()
+    ]
+
+    if snapshot.dates:
+        summaries = summarize(snapshot.weights, snapshot.calories_in)
+        # The stored entries before cut only need a look if they had a zero before
+        summaries["zero_weights"] = bool((tail.weights == 0).any()) or (
+            previous_zero_weights and 0 in snapshot.raw_weights[:cut]
+        )
+        summaries["zero_calories"] = bool((tail.calories_in == 0).any()) or (
+            previous_zero_calories and 0 in snapshot.calories_in[:cut]
+        )
+        snapshot.summaries = summaries
+
+        # Rows of the weeks before since are kept unless their TDEE window reaches the
+        # weights imputed again, a TDEE spans the logs of two rows, see weekly_table
+        rows = snapshot.weekly.get("I", []) if since is not None else []
+        kept = 0
+        if rows and "period" in rows[0]:
+            monday = since.toordinal() - since.weekday()
+            kept = min(bisect_left([row["period"] for row in rows], monday), start // 7)
+        # The week before is reloaded for the weight change into the first new row
+        first = max(kept - 1, 0)
+        if first:
+            logs = logs.filter(date__gte=date.fromordinal(rows[first]["period"]))
+        weeks = rollups.weekly(logs)
+        snapshot.weekly = {
+            preference: snapshot.weekly.get(preference, [])[:kept]
+            + weekly_table(weeks, weights, snapshot.calories_in, units, first)[
+                kept - first :
+            ]
+            for preference, weights, units in [
+                ("I", snapshot.weights, "lbs"),
+                ("M", snapshot.weights_kg, "kgs"),
+            ]
+        }
+    else:
+        snapshot.summaries = {}
+        snapshot.weekly = {}
+
+    snapshot.save()
+    return snapshot
+
+
+def imputation_start(raw_weights, cut):
+    """
+    Index from which zero weights have to be imputed again after the entries from cut onwards changed
+    """
+
+    nonzero = 0
+    for index in range(cut - 1, -1, -1):
+        if raw_weights[index]:
+            nonzero += 1
+            if nonzero == IMPUTATION_WINDOW:
+                return index
+    return 0
+
+
+def summarize(weights, calories_in):
+    """
+    Numbers of the analytics page that only depend on the logs, for every range in RANGES
+
+    The fixed ranges are calculated from the last SUMMARY_TAIL logs only, which gives
+    the same numbers as the whole series.
+
+    Parameters
+    ----------
+    weights : smoothed weights in lbs
+        list
+    calories_in : daily caloric intake
+        list
+
+    Returns
+    -------
+    dict
+    """
+
+    tail = max(len(weights) - SUMMARY_TAIL, 0)
+    if len(weights) < 5:
+        currentweight = weights[-1]
+    else:
+        currentweight = moving_average(weights[tail:])[-1]
+
+    lengths = [int(key) for key in RANGES if key != "all"]
+    ranges = summarize_ranges(
+        weights[tail:],
+        calories_in[tail:],
+        [(len(weights) - tail - n, len(weights) - tail) for n in lengths],
+    )
+    ranges += summarize_ranges(weights, calories_in, [(0, len(weights))])
+
+    return {"currentweight": float(currentweight), "ranges": dict(zip(RANGES, ranges))}
+
+
+def summarize_ranges(weights, calories_in, bounds):
+    """
+    Weight change and TDEE over several ranges of the logs at once
+
+    Parameters
+    ----------
+    weights : smoothed weights in lbs
+        list
+    calories_in : daily caloric intake
+        list
+    bounds : (start, stop) indices of every range. start may be negative for ranges
+        longer than the logs, they are then calculated over all logs up to stop
+        list of tuple
+
+    Returns
+    -------
+    list of dict
+        one per range, TDEE is only included with 10 or more logs
+    """
+
+    lengths = [stop - start for start, stop in bounds]
+
+    # With less than 10 logs TDEE comes from the Harris-Benedict formula instead
+    if len(weights) >= 10:
+        TDEEs = rolling_TDEE(
+            calories_in,
+            weights,
+            [(0, stop) for _, stop in bounds],
+            n=[max(n, 10) for n in lengths],
+            smooth=True,
+            window=3,
+        )
+
+    summaries = []
+    for i, (_, stop) in enumerate(bounds):
+        n = lengths[i]
+        summary = {
+            "weightchangeraw": float(weight_change(weights[:stop], n=n, smooth=False)),
+            "weightchangesmooth": float(
+                weight_change(weights[:stop], n=n, smooth=True)
+            ),
+        }
+        if len(weights) >= 10:
+            summary["TDEE"] = TDEEs[i]
+        summaries.append(summary)
+
+    return summaries
+
+
+def weekly_table(weeks, weights, calories_in, units, first=0):
+    """
+    Rows of the weekly summaries table. The TDEE of the current week is left to the view.
+
+    Parameters
+    ----------
+    weeks : weekly rollups of the logs from the week at index first on, see
+        rollups.weekly
+        list of dict
+    weights : smoothed weights in units of all logs, used for the weekly TDEE
+        list
+    calories_in : daily caloric intake of all logs
+        list
+    units : unit of weights
+        string: "lbs" or "kgs"
+    first : index of weeks[0] among all weeks. Its row has no weight change unless it
+        is the first week
+        int, default = 0
+
+    Returns
+    -------
+    list of dict
+    """
+
+    grams = GRAMS_PER_LB if units == "lbs" else GRAMS_PER_KG
+
+    # TDEE of every week over the logs of the week before and this week. Only the logs
+    # from the week before the first are passed, the windows are relative to them
+    offset = max(first - 1, 0) * 7
+    TDEEs = rolling_TDEE(
+        calories_in[offset:],
+        weights[offset:],
+        [
+            ((i - 1) * 7 - offset, (i + 1) * 7 - offset)
+            for i in range(first, first + len(weeks))
+        ],
+        n=len(weights),
+        units=units,
+        smooth=True,
+        window=3,
+    )
+
+    weeklytabledata = []
+    previous_weight = None
+    for i, week in enumerate(weeks, first):
+        # Weeks with only 0 weights logged have no weight
+        weight = week["weight_mean"] / grams if week["weight_mean"] else None
+
+        entry = {}
+        entry["week_number"] = i
+        entry["period"] = week["period"].toordinal()
+        entry["weeks"] = (
+            week["first_date"].strftime("%b-%-d")
+            + " - "
+            + week["last_date"].strftime("%b-%-d")
+        )
+        entry["weeklycalories_in_mean"] = round(week["calories_in_mean"])
+        entry["weeklycalories_in_total"] = week["calories_in_total"]
+        entry["weeklyweights"] = round(weight, 2) if weight is not None else "N/A"
+        if i == 0:
+            entry["weeklyweightchange"] = 0.00
+            entry["TDEE"] = "N/A"
+        else:
+            if weight is not None and previous_weight is not None:
+                entry["weeklyweightchange"] = round(weight - previous_weight, 2)
+            else:
+                entry["weeklyweightchange"] = "N/A"
+            entry["TDEE"] = TDEEs[i - first]
+        weeklytabledata.append(entry)
+        previous_weight = weight
+
+    return weeklytabledata
+
+
+def log_changed(user, since):
+    """
+    Called from signals.py whenever a Log of user dated since was saved or deleted
+    """
+
+    pending = getattr(_deferred, "users", None)
+    if pending is not None and user.pk in pending:
+        since = to_date(since)
+        if pending[user.pk] is None or since < pending[user.pk]:
+            pending[user.pk] = since
+        return
+
+    # Snapshots are built on first view, so there is nothing to update if none exists
+    refresh_snapshot(user, since=since, create=False)
+    analytics_cache.logs_changed(user)
+
+
+@contextmanager
+def defer_refresh(user):
+    """
+    Collects the Log changes made for user inside the block into a single snapshot
+    refresh on exit. Used by the imports, which write many logs in a row.
+    Writes that bypass signals (e.g. queryset.update()) should call log_changed themselves.
+    """
+
+    if getattr(_deferred, "users", None) is None:
+        _deferred.users = {}
+    if user.pk in _deferred.users:
+        # Nested block, the outermost one does the refresh
+        yield
+        return
+
+    _deferred.users[user.pk] = None
+    try:
+        yield
+    finally:
+        since = _deferred.users.pop(user.pk)
+        if since is not None:
+            refresh_snapshot(user, since=since, create=False)
+            # Contexts cached while the block ran were calculated from the old snapshot
+            analytics_cache.logs_changed(user)
@@ -1,8 +1,9 @@
+var calorieChart;  // updated when switching ranges, see analytics.html
 var ctx = document.getElementById("calorieChart");
 
 async function createCalorieChart() {
 
-    var myLineChart = new Chart(ctx, {
+    calorieChart = new Chart(ctx, {
       type: 'line',
       data: {
         labels: timestamps,
@@ -1,8 +1,9 @@
+var weightChart;  // updated when switching ranges, see analytics.html
 var ctx = document.getElementById("weightChart");
 
 async function createWeightChart() {
 
-    var myLineChart = new Chart(ctx, {
+    weightChart = new Chart(ctx, {
       type: 'line',
       data: {
         labels: timestamps,
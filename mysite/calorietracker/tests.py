@@ -1,3 +1,1118 @@
-from django.test import TestCase
+import datetime
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import myfitnesspal
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from measurement.measures import Energy, Weight
+from safedelete.models import HARD_DELETE
+
+from . import mfp_throttle, payloads, rollups
+from .dateparsing import date_parser
+from .importer import import_csv, merge_logs
+from .imputation import backfill_imputed_weights, impute_zero_weights
+from .mfp_cache import get_weights, iter_day_totals
+from .mfp_fake import FakeMFPServer
+from .mfp_fetch import fetch_days, with_retries
+from .mfp_sessions import (
+    SessionExpiredError,
+    SessionPool,
+    session_key,
+    with_session,
+)
+from .mfp_sync import sync_range, sync_user
+from .mfpimport_views import import_mfp
+from .models import AnalyticsSnapshot, ImportJob, Log, MFPCredentials
+from .series import LogSeries
+from .snapshots import refresh_snapshot
+from .utilities import calculate_TDEE, rolling_TDEE
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class AnalyticsTestCase(TestCase):
+    """
+    A user with 30 days of logs whose analytics snapshot is already built
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test")
+        self.user.setting.goal_date = datetime.datetime.now(
+            datetime.timezone.utc
+        ) + datetime.timedelta(days=30)
+        self.user.setting.save()
+
+        start = datetime.date(2020, 6, 14)
+        for i in range(30):
+            Log.objects.create(
+                user=self.user,
+                date=start + datetime.timedelta(days=i),
+                weight=Weight(lb=200 - i * 0.2),
+                calories_in=2000,
+            )
+        self.client.force_login(self.user)
+        # Build the analytics snapshot so only the page view itself is counted
+        self.client.get(reverse("analytics"))
+
+    def get_analytics(self, **params):
+        response = self.client.get(reverse("analytics"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def chart(self, response):
+        return json.loads(response.context["chart_json"])
+
+
+class AnalyticsQueryCountTest(AnalyticsTestCase):
+    def test_analytics_query_count(self):
+        # Count the queries of calculating the page, not of serving it from the cache
+        cache.clear()
+        # session, user, log exists check, settings, snapshot
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("analytics"))
+        self.assertEqual(response.status_code, 200)
+
+
+class AnalyticsCacheTest(AnalyticsTestCase):
+    backends = {
+        "locmem": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "file": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(tempfile.gettempdir(), "calorietracker-tests"),
+        },
+        "db": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "calorietracker_tests_cache",
+        },
+    }
+
+    def test_cache_backends(self):
+        for i, (name, backend) in enumerate(self.backends.items()):
+            with self.subTest(backend=name), self.settings(CACHES={"default": backend}):
+                if name == "db":
+                    call_command("createcachetable", verbosity=0)
+                cache.clear()
+
+                first = self.get_analytics()
+                with mock.patch("calorietracker.analytics_view.get_snapshot") as load:
+                    second = self.get_analytics()
+                    load.assert_not_called()
+                self.assertEqual(first.context["TDEE"], second.context["TDEE"])
+                self.assertEqual(self.chart(first), self.chart(second))
+
+                # A new log invalidates the cached page
+                day = datetime.date(2020, 7, 14) + datetime.timedelta(days=i)
+                Log.objects.create(
+                    user=self.user, date=day, weight=Weight(kg=70), calories_in=1000
+                )
+                response = self.get_analytics()
+                self.assertEqual(len(self.chart(response)["weights"]), 31 + i)
+                self.assertEqual(self.chart(response)["weights"][-1], 70)
+
+                # update() bypasses signals, the import paths bump the version themselves
+                merge_logs(self.user, True, weights={day: Weight(kg=60)})
+                self.assertEqual(self.chart(self.get_analytics())["weights"][-1], 60)
+
+                # So does saving the settings
+                self.user.setting.unit_preference = "I"
+                self.user.setting.save()
+                self.assertEqual(self.get_analytics().context["units_weight"], "lbs")
+                self.user.setting.unit_preference = "M"
+                self.user.setting.save()
+                self.assertEqual(self.get_analytics().context["units_weight"], "kgs")
+
+    def test_ranges_cached_separately(self):
+        cache.clear()
+        self.assertEqual(self.get_analytics(rangeDrop="7").context["n"], 7)
+        self.assertEqual(self.get_analytics(rangeDrop="14").context["n"], 14)
+        self.assertEqual(self.get_analytics(rangeDrop="7").context["n"], 7)
+        self.assertEqual(self.get_analytics().context["n"], 30)
+
+
+class AnalyticsRangesTest(AnalyticsTestCase):
+    def test_all_ranges_in_one_response(self):
+        response = self.get_analytics(rangeDrop="14")
+        ranges = json.loads(response.context["ranges_json"])
+        self.assertEqual(list(ranges), ["7", "14", "31", "all"])
+        self.assertEqual([ranges[key]["n"] for key in ranges], [7, 14, 31, 30])
+        self.assertEqual(response.context["n"], 14)
+        self.assertEqual(response.context["TDEE"], ranges["14"]["TDEE"])
+        # Every range is taken from the same logs in the browser
+        self.assertEqual(len(self.chart(response)["weights"]), 30)
+
+    def test_custom_range(self):
+        response = self.get_analytics(start="2020-06-20", end="2020-06-29")
+        self.assertEqual(response.context["range_option"], "custom")
+        self.assertEqual(list(json.loads(response.context["ranges_json"])), ["custom"])
+        self.assertEqual(response.context["n"], 10)
+        self.assertEqual(len(self.chart(response)["weights"]), 10)
+        self.assertEqual(
+            datetime.date(1970, 1, 1)
+            + datetime.timedelta(days=self.chart(response)["days"][0]),
+            datetime.date(2020, 6, 20),
+        )
+
+        # Nothing logged in the range, all logs are shown instead
+        response = self.get_analytics(start="2021-01-01", end="2021-01-31")
+        self.assertEqual(response.context["range_option"], "all")
+        self.assertEqual(response.context["n"], 30)
+
+
+class RollupTest(TestCase):
+    def test_weeks_of_different_years_are_separate(self):
+        user = get_user_model().objects.create(username="test")
+        for day in [datetime.date(2019, 12, 30), datetime.date(2020, 12, 28)]:
+            for i in range(3):
+                Log.objects.create(
+                    user=user,
+                    date=day + datetime.timedelta(days=i),
+                    weight=Weight(g=0 if i == 0 else 80000),
+                    calories_in=2000 + i,
+                )
+
+        weeks = rollups.weekly(Log.objects.filter(user=user))
+        self.assertEqual(
+            [week["period"] for week in weeks],
+            [datetime.date(2019, 12, 30), datetime.date(2020, 12, 28)],
+        )
+        self.assertEqual([week["calories_in_total"] for week in weeks], [6003, 6003])
+        # 0 weights are left out
+        self.assertEqual([week["weight_mean"] for week in weeks], [80000, 80000])
+
+        months = rollups.monthly(Log.objects.filter(user=user))
+        self.assertEqual([month["days"] for month in months], [2, 1, 3])
+
+
+class RefreshSnapshotTest(TestCase):
+    def test_incremental_refresh_matches_rebuild(self):
+        user = get_user_model().objects.create(username="test")
+        days = [
+            datetime.date(2020, 6, 14) + datetime.timedelta(days=i) for i in range(71)
+        ]
+        Log.objects.bulk_create(
+            Log(
+                user=user,
+                date=days[i],
+                # Zero weights on both sides of the changed dates
+                weight=Weight(kg=0 if i % 7 in (2, 3) else 90 - i * 0.1),
+                calories_in=1800 + i,
+            )
+            for i in range(60)
+        )
+        refresh_snapshot(user)
+
+        # Changed without signals, so only the refresh below picks them up
+        Log.objects.filter(user=user, date__range=(days[40], days[44])).update(
+            weight=Weight(kg=0), calories_in=2500
+        )
+        Log.objects.filter(user=user, date=days[50]).update(weight=Weight(kg=85))
+        Log.objects.bulk_create(
+            [Log(user=user, date=days[70], weight=Weight(kg=84), calories_in=2000)]
+        )
+
+        incremental = self.fields(refresh_snapshot(user, since=days[40]))
+        self.assertEqual(incremental, self.fields(refresh_snapshot(user)))
+        self.assertEqual(len(incremental["dates"]), 61)
+
+    def test_log_moved_to_later_date(self):
+        user = get_user_model().objects.create(username="test")
+        days = [
+            datetime.date(2020, 6, 14) + datetime.timedelta(days=i) for i in range(120)
+        ]
+        Log.objects.bulk_create(
+            Log(
+                user=user,
+                date=days[i],
+                weight=Weight(kg=0 if i % 5 == 1 else 90 - i * 0.1),
+                calories_in=1800 + i,
+            )
+            for i in range(100)
+        )
+        refresh_snapshot(user)
+
+        # The snapshot is refreshed from the date the log was loaded with
+        log = Log.objects.get(user=user, date=days[80])
+        log.date = days[110]
+        log.save()
+        Log.objects.create(
+            user=user, date=days[105], weight=Weight(kg=0), calories_in=0
+        )
+
+        incremental = self.fields(AnalyticsSnapshot.objects.get(user=user))
+        self.assertEqual(incremental, self.fields(refresh_snapshot(user)))
+        self.assertNotIn(days[80].toordinal(), incremental["dates"])
+        self.assertTrue(incremental["summaries"]["zero_calories"])
+
+    @staticmethod
+    def fields(snapshot):
+        return {
+            field: getattr(snapshot, field)
+            for field in [
+                "dates",
+                "raw_weights",
+                "weights",
+                "weights_kg",
+                "calories_in",
+                "summaries",
+                "weekly",
+            ]
+        }
+
+
+class MergeLogsTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test")
+        self.start = datetime.date(2020, 6, 14)
+        Log.objects.create(
+            user=self.user, date=self.start, weight=Weight(kg=70), calories_in=2000
+        )
+        deleted = Log.objects.create(
+            user=self.user,
+            date=self.start + datetime.timedelta(days=1),
+            weight=Weight(kg=71),
+            calories_in=2100,
+        )
+        deleted.delete()
+
+    def merge(self, overwrite, days):
+        dates = [self.start + datetime.timedelta(days=i) for i in range(days)]
+        return merge_logs(
+            self.user,
+            overwrite,
+            weights={day: Weight(kg=80) for day in dates},
+            calories_in={day: 1500 for day in dates},
+            chunk_size=100,
+        )
+
+    def test_merge(self):
+        # The existing logs, per chunk a savepoint, the insert, the update if
+        # any and the release, then the snapshot
+        with self.assertNumQueries(9):
+            counts = self.merge(False, 150)
+        self.assertEqual(counts, {"created": 148, "updated": 1, "skipped": 1})
+
+        logs = Log.objects.filter(user=self.user).order_by("date")
+        self.assertEqual(logs.count(), 150)
+        # Kept without overwrite
+        self.assertEqual((logs[0].weight.kg, logs[0].calories_in), (70, 2000))
+        # The soft deleted log is restored with the imported values
+        self.assertEqual((logs[1].weight.kg, logs[1].calories_in), (80, 1500))
+        # New logs get both imported values
+        self.assertEqual((logs[2].weight.kg, logs[2].calories_in), (80, 1500))
+
+        counts = self.merge(True, 1)
+        self.assertEqual(counts, {"created": 0, "updated": 1, "skipped": 0})
+        self.assertEqual(logs[0].calories_in, 1500)
+
+    def test_merge_different_dates(self):
+        # Weights and calories of different dates are written in the same bulk_update
+        dates = [self.start + datetime.timedelta(days=i) for i in range(2, 102)]
+        merge_logs(self.user, False, calories_in={day: 1000 for day in dates})
+        with self.assertNumQueries(5):
+            counts = merge_logs(
+                self.user,
+                True,
+                weights={day: Weight(kg=75) for day in dates[::2]},
+                calories_in={day: 1800 for day in dates[1::2]},
+            )
+        self.assertEqual(counts, {"created": 0, "updated": 100, "skipped": 0})
+        logs = Log.objects.filter(user=self.user, date__in=dates[:2]).order_by("date")
+        self.assertEqual((logs[0].weight.kg, logs[0].calories_in), (75, 1000))
+        self.assertEqual((logs[1].weight.kg, logs[1].calories_in), (0, 1800))
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class ImportCSVTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test")
+        self.client.force_login(self.user)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def import_csv(self, rows):
+        """
+        Uploads rows, runs the import worker and returns the job's progress
+        """
+
+        data_file = SimpleUploadedFile(
+            "logs.csv",
+            "\n".join(["Date,Weight,Calories_In"] + rows).encode(),
+            content_type="text/csv",
+        )
+        response = self.client.post(
+            reverse("importcsv"),
+            {
+                "data_file": data_file,
+                "weight_units": "kg",
+                "date_format": "YMD",
+                "csv_overwrite": "True",
+            },
+        )
+        job = ImportJob.objects.get(user=self.user)
+        self.assertRedirects(response, reverse("import-job", args=[job.pk]))
+        # Nothing is imported in the request
+        self.assertEqual(job.status, "Q")
+        self.assertFalse(Log.objects.filter(user=self.user).exists())
+
+        # The worker closes its connection between jobs, which would end the test's
+        # transaction
+        with mock.patch(
+            "calorietracker.management.commands.run_import_worker.close_old_connections"
+        ):
+            call_command("run_import_worker", "--once", stdout=StringIO())
+        response = self.client.get(reverse("import-job-progress", args=[job.pk]))
+        return response.json()
+
+    def test_import_in_chunks(self):
+        start = datetime.date(2018, 1, 1)
+        rows = [
+            "%s,%d,%d" % (start + datetime.timedelta(days=i), 80, 2000 + i)
+            for i in range(2500)
+        ]
+        progress = self.import_csv(rows)
+        self.assertEqual(
+            [progress[key] for key in ("status", "rows_processed", "logs_created")],
+            ["Done", 2500, 2500],
+        )
+
+        logs = Log.objects.filter(user=self.user).order_by("date")
+        self.assertEqual(logs.count(), 2500)
+        self.assertEqual((logs.last().weight.kg, logs.last().calories_in), (80, 4499))
+
+    def test_validation_reports_progress(self):
+        start = datetime.date(2018, 1, 1)
+        rows = [
+            "%s,%d,%d" % (start + datetime.timedelta(days=i), 80, 2000)
+            for i in range(2500)
+        ]
+        f = StringIO("\n".join(["Date,Weight,Calories_In"] + rows))
+        progress = mock.Mock()
+        # The file is read once, its lines do not have to be seekable
+        lines = (line for line in f)
+        self.assertEqual(import_csv(self.user, lines, True, "YMD", "kg", progress), [])
+        self.assertEqual(Log.objects.filter(user=self.user).count(), 2500)
+        # A call per validated chunk before any row is merged, so a long validation
+        # is not taken for a dead worker
+        self.assertEqual(
+            progress.call_args_list[:4],
+            [mock.call(), mock.call(), mock.call(), mock.call(rows_total=2500)],
+        )
+
+    def test_error_in_later_chunk_fails_the_import(self):
+        start = datetime.date(2018, 1, 1)
+        rows = [
+            "%s,%d,%d" % (start + datetime.timedelta(days=i), 80, 2000)
+            for i in range(1500)
+        ]
+        rows[1200] = "2021-01-01,eighty,2000"
+        progress = self.import_csv(rows)
+        self.assertEqual(progress["status"], "Failed")
+        self.assertEqual(
+            progress["errors"], ["Could not parse weight: eighty at row number 1201"]
+        )
+        self.assertFalse(Log.objects.filter(user=self.user).exists())
+
+
+class DateParsingTest(TestCase):
+    def test_date_parser(self):
+        today = datetime.date(2020, 7, 1)
+
+        parse = date_parser("MDY", ["14-Jun", "15-Jun"], today)
+        self.assertEqual(parse.pattern, "%d-%b")
+        self.assertEqual(parse("16-Jun"), datetime.date(2020, 6, 16))
+
+        parse = date_parser("DMY", ["14.06.2020", "01.07.2020"], today)
+        self.assertEqual(parse.pattern, "%d.%m.%Y")
+        self.assertEqual(parse("02.07.2020"), datetime.date(2020, 7, 2))
+        # Rows in another format fall back to dateutil
+        self.assertEqual(parse("2020-07-03"), datetime.date(2020, 3, 7))
+        with self.assertRaises(ValueError):
+            parse("not a date")
+
+        # dateutil reads these with dayfirst as 2020-04-06 and 2020-06-14, no pattern
+        # agrees with both
+        parse = date_parser("DMY", ["2020-06-04", "2020-06-14"], today)
+        self.assertIsNone(parse.pattern)
+        self.assertEqual(parse("2020-06-04"), datetime.date(2020, 4, 6))
+
+        # Here the samples do agree, but not the later rows whose day could be the
+        # month, the pattern is rejected up front
+        parse = date_parser("DMY", ["2020-06-14", "2020-06-15"], today)
+        self.assertIsNone(parse.pattern)
+        self.assertEqual(parse("2020-06-16"), datetime.date(2020, 6, 16))
+        self.assertEqual(parse("2020-06-04"), datetime.date(2020, 4, 6))
+
+
+class FakeMFPClient:
+    """
+    Stands in for myfitnesspal.Client, get_date fails the first time for some dates
+    """
+
+    effective_username = "mfpuser"
+    user_metadata = {"unit_preferences": {"weight": "kilograms"}}
+
+    def __init__(self, failing_dates=()):
+        self.session = requests.Session()
+        self.failing_dates = set(failing_dates)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    def get_date(self, date):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Later days answer first
+            time.sleep(0.001 * (date.day % 5))
+            with self.lock:
+                if date in self.failing_dates:
+                    self.failing_dates.remove(date)
+                    raise requests.ConnectionError
+            return SimpleNamespace(totals={"calories": Energy(Calorie=date.day)})
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def get_measurements(self, measurement, lower_bound, upper_bound):
+        with self.lock:
+            self.requests += 1
+        # A weight every other day
+        return {
+            lower_bound + datetime.timedelta(days=i): 80.0
+            for i in range(0, (upper_bound - lower_bound).days + 1, 2)
+        }
+
+
+@override_settings(MFP_FETCH_BACKOFF=0, MFP_RATE_LIMIT=0)
+class FetchDaysTest(TestCase):
+    def test_fetch_days(self):
+        start = datetime.date(2020, 1, 1)
+        end = datetime.date(2020, 3, 31)
+        client = FakeMFPClient(failing_dates=[start, datetime.date(2020, 2, 10)])
+
+        days = list(fetch_days(client, start, end, concurrency=4))
+        self.assertEqual(
+            [(date, day.totals["calories"].C) for date, day in days],
+            [
+                (
+                    start + datetime.timedelta(days=i),
+                    (start + datetime.timedelta(days=i)).day,
+                )
+                for i in range(91)
+            ],
+        )
+        self.assertLessEqual(client.max_in_flight, 4)
+        self.assertGreater(client.max_in_flight, 1)
+        # The two failed requests were retried
+        self.assertEqual(client.requests, 93)
+
+    def test_gives_up_after_retries(self):
+        start = datetime.date(2020, 1, 1)
+        client = FakeMFPClient(failing_dates=[start])
+        with self.assertRaises(requests.ConnectionError):
+            list(fetch_days(client, start, start, retries=0))
+
+
+@override_settings(MFP_RATE_LIMIT=0)
+class MFPCacheTest(TestCase):
+    def test_day_totals(self):
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=30)
+        client = FakeMFPClient()
+
+        totals = list(iter_day_totals(client, start, today))
+        self.assertEqual(client.requests, 31)
+        self.assertEqual(totals[0], (start, {"calories": start.day}))
+
+        # Cached
+        self.assertEqual(list(iter_day_totals(client, start, today)), totals)
+        self.assertEqual(client.requests, 31)
+
+        # Only the recent days expire
+        with override_settings(MFP_CACHE_TTL=0):
+            self.assertEqual(list(iter_day_totals(client, start, today)), totals)
+        self.assertEqual(client.requests, 31 + 7)
+
+    def test_weights(self):
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=30)
+        client = FakeMFPClient()
+
+        weights = get_weights(client, start, today)
+        self.assertEqual(len(weights), 16)
+        self.assertEqual(weights[start].kg, 80)
+        self.assertEqual(client.requests, 1)
+
+        self.assertEqual(get_weights(client, start, today), weights)
+        self.assertEqual(client.requests, 1)
+        # Days before the cached ones are fetched
+        get_weights(client, start - datetime.timedelta(days=5), today)
+        self.assertEqual(client.requests, 2)
+
+
+@override_settings(MFP_SYNC_INITIAL_DAYS=30, MFP_SYNC_OVERLAP_DAYS=3, MFP_RATE_LIMIT=0)
+class MFPSyncTest(TestCase):
+    def test_sync_user(self):
+        user = get_user_model().objects.create(username="sync")
+        credentials = MFPCredentials.objects.create(
+            user=user, username="mfpuser", password="x", sync_overwrite=True
+        )
+        today = datetime.date(2020, 6, 30)
+        client = FakeMFPClient()
+
+        counts = sync_user(credentials, today, client)
+        self.assertEqual(
+            counts, {"days": 30, "created": 30, "updated": 0, "skipped": 0}
+        )
+        self.assertEqual(credentials.last_synced_date, today)
+        log = Log.objects.get(user=user, date=datetime.date(2020, 6, 1))
+        self.assertEqual((log.calories_in, log.weight.kg), (1, 80))
+
+        # The next day only the overlap and the new days are synced
+        tomorrow = today + datetime.timedelta(days=1)
+        self.assertEqual(
+            sync_range(credentials, tomorrow),
+            (datetime.date(2020, 6, 27), tomorrow),
+        )
+        counts = sync_user(credentials, tomorrow, client)
+        self.assertEqual(counts, {"days": 5, "created": 1, "updated": 4, "skipped": 0})
+        self.assertEqual(Log.objects.filter(user=user).count(), 31)
+
+    def test_manual_log_survives_sync(self):
+        user = get_user_model().objects.create(username="sync")
+        credentials = MFPCredentials.objects.create(
+            user=user, username="mfpuser", password="x", sync_weights=False
+        )
+        today = datetime.date(2020, 6, 30)
+        manual = Log.objects.create(
+            user=user, date=today, weight=Weight(kg=70), calories_in=2222
+        )
+
+        counts = sync_user(credentials, today, FakeMFPClient())
+        self.assertEqual(
+            counts, {"days": 30, "created": 29, "updated": 0, "skipped": 1}
+        )
+        manual.refresh_from_db()
+        self.assertEqual((manual.calories_in, manual.weight.kg), (2222, 70))
+        # Only the calories were synced into the new logs
+        log = Log.objects.get(user=user, date=datetime.date(2020, 6, 1))
+        self.assertEqual((log.calories_in, log.weight.kg), (1, 0))
+
+
+class MFPSessionPoolTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create(username="test")
+        self.credentials = MFPCredentials.objects.create(
+            user=user, username="mfpuser", password="x"
+        )
+
+    def login(self, credentials):
+        client = myfitnesspal.Client(credentials.username, password="", login=False)
+        client.session.cookies.set("session", "logged-in")
+        client._auth_data = {"access_token": "token", "expires_in": 3600}
+        client._user_metadata = {"username": "mfpuser"}
+        return client
+
+    def test_sessions_are_reused(self):
+        with mock.patch("calorietracker.mfp_sessions.login", wraps=self.login) as login:
+            pool = SessionPool()
+            client = pool.get(self.credentials)
+            self.assertIs(pool.get(self.credentials), client)
+            self.assertEqual(login.call_count, 1)
+
+            # Another process restores the session from the cache
+            restored = SessionPool().get(self.credentials)
+            self.assertIsNot(restored, client)
+            self.assertEqual(restored.session.cookies["session"], "logged-in")
+            self.assertEqual(restored.effective_username, "mfpuser")
+            self.assertEqual(login.call_count, 1)
+
+            # Expired sessions log in again
+            with override_settings(MFP_SESSION_MAX_AGE=0):
+                SessionPool().get(self.credentials)
+                SessionPool().get(self.credentials)
+            self.assertEqual(login.call_count, 3)
+
+    def test_expired_sessions_log_in_again(self):
+        today = datetime.date.today()
+        with FakeMFPServer(history_days=5) as server, mock.patch(
+            "calorietracker.mfp_sessions.pool", SessionPool()
+        ), mock.patch(
+            "calorietracker.mfp_sessions.login",
+            side_effect=lambda credentials: server.client(),
+        ) as login:
+            client = with_session(self.credentials, lambda client: client)
+            # Neither the tokens nor the cookies are cached in plaintext
+            cached = cache.get(session_key(self.credentials.user_id))
+            self.assertIsInstance(cached, bytes)
+            self.assertNotIn(b"access-token", cached)
+
+            server.session_expired = True
+            # Rather than an empty diary
+            with self.assertRaises(SessionExpiredError):
+                client.get_date(today)
+            day = with_session(self.credentials, lambda client: client.get_date(today))
+            self.assertEqual(round(day.totals["calories"].C), server.calories(today))
+            self.assertEqual(login.call_count, 2)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@override_settings(
+    MFP_RATE_LIMIT=5,
+    MFP_BREAKER_THRESHOLD=3,
+    MFP_BREAKER_WINDOW=60,
+    MFP_BREAKER_COOLDOWN=60,
+)
+class MFPThrottleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock(1000.0)
+        patcher = mock.patch.object(mfp_throttle, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate_limit(self):
+        for _ in range(12):
+            mfp_throttle.before_request()
+        # 5 requests in each of the first two seconds
+        self.assertEqual(int(self.clock.now), 1002)
+        self.assertEqual(mfp_throttle.traffic_status()["requests_this_second"], 2)
+
+    def test_circuit_breaker(self):
+        for _ in range(3):
+            mfp_throttle.record_failure(False)
+        with self.assertRaises(mfp_throttle.CircuitOpenError):
+            mfp_throttle.before_request()
+        self.assertEqual(mfp_throttle.traffic_status()["state"], "open")
+
+        # One trial request once cooled down
+        self.clock.sleep(61)
+        self.assertTrue(mfp_throttle.before_request())
+        with self.assertRaises(mfp_throttle.CircuitOpenError):
+            mfp_throttle.before_request()
+        mfp_throttle.record_success(True)
+        self.assertEqual(mfp_throttle.traffic_status()["state"], "closed")
+        self.assertFalse(mfp_throttle.before_request())
+
+    def test_trial_released_on_other_errors(self):
+        for _ in range(3):
+            mfp_throttle.record_failure(False)
+        self.clock.sleep(61)
+
+        def expired():
+            raise SessionExpiredError()
+
+        # Says nothing about MFP, the breaker stays half-open for the next request
+        with self.assertRaises(SessionExpiredError):
+            with_retries(expired, retries=0)
+        self.assertEqual(mfp_throttle.traffic_status()["state"], "half-open")
+        self.assertTrue(mfp_throttle.before_request())
+
+    def test_cache_backend_check(self):
+        self.assertEqual(mfp_throttle.check_cache_backend(None), [])
+        database_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                "LOCATION": "calorietracker_tests_cache",
+            }
+        }
+        with self.settings(CACHES=database_cache):
+            self.assertEqual(
+                [warning.id for warning in mfp_throttle.check_cache_backend(None)],
+                ["calorietracker.W001"],
+            )
+
+
+@override_settings(MFP_RATE_LIMIT=0, MFP_FETCH_BACKOFF=0, MFP_BREAKER_THRESHOLD=100)
+class FakeMFPServerTest(TestCase):
+    def test_import(self):
+        cache.clear()
+        user = get_user_model().objects.create(username="test")
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=59)
+
+        with FakeMFPServer(history_days=40) as server:
+            client = server.client()
+            # Failed requests are retried
+            server.error_rate = 0.05
+            counts = import_mfp(user, client, "CI", False, start, today)
+            self.assertEqual(counts, {"created": 40, "updated": 0})
+            counts = import_mfp(user, client, "Weights", True, start, today)
+
+        logs = {log.date: log for log in Log.objects.filter(user=user)}
+        self.assertEqual(len(logs), 40 + counts["created"])
+        for day, log in logs.items():
+            self.assertEqual(log.calories_in, server.calories(day) or 0)
+            self.assertAlmostEqual(log.weight.kg, server.weight(day) or 0)
+
+
+class RollingTDEETest(TestCase):
+    def test_matches_calculate_TDEE(self):
+        rng = random.Random(0)
+        CI = [rng.randint(1200, 3500) for _ in range(60)]
+        weights = [round(90 - i * 0.05 + rng.uniform(-1, 1), 1) for i in range(60)]
+        windows = [(0, 60), (0, 2), (10, 13), (5, 9), (20, 40), (45, 60), (30, 31)]
+        for units, smooth, n in itertools.product(
+            ["lbs", "kgs"], [True, False], [1, 3, 7, 14, 31, 60, 100]
+        ):
+            with self.subTest(units=units, smooth=smooth, n=n):
+                expected = [
+                    calculate_TDEE(
+                        CI[start:stop], weights[start:stop], n, units, smooth
+                    )
+                    for start, stop in windows
+                ]
+                self.assertEqual(
+                    rolling_TDEE(CI, weights, windows, n, units, smooth), expected
+                )
+
+
+class ImputeZeroWeightsTest(TestCase):
+    def impute(self, dates, weights, window=2):
+        imputed, mask = impute_zero_weights(dates, weights, window=window)
+        return [round(weight, 2) for weight in imputed.tolist()], mask.tolist()
+
+    def test_impute(self):
+        # Leading zeros get the mean of the first window weights
+        self.assertEqual(
+            self.impute([0, 1, 2, 3, 4], [0, 0, 80, 82, 90]),
+            ([81, 81, 80, 82, 90], [True, True, False, False, False]),
+        )
+        # Trailing zeros the mean of the last window weights before them
+        self.assertEqual(
+            self.impute([0, 1, 2, 3, 4], [70, 80, 82, 0, 0]),
+            ([70, 80, 82, 81, 81], [False, False, False, True, True]),
+        )
+        # Zeros between weights are interpolated by date, not by position
+        self.assertEqual(
+            self.impute([0, 1, 3, 7], [80, 0, 0, 88]),
+            ([80, 81.14, 83.43, 88], [False, True, True, False]),
+        )
+        # A window larger than the number of weights averages all of them
+        self.assertEqual(
+            self.impute([0, 1, 2], [0, 80, 84], window=10),
+            ([82, 80, 84], [True, False, False]),
+        )
+
+    def test_nothing_to_impute(self):
+        self.assertEqual(self.impute([0, 1, 2], [0, 0, 0]), ([0, 0, 0], [False] * 3))
+        self.assertEqual(self.impute([0, 1], [80, 81]), ([80, 81], [False, False]))
+        self.assertEqual(self.impute([], []), ([], []))
+
+
+class BackfillImputedWeightsTest(TestCase):
+    def test_backfill(self):
+        user = get_user_model().objects.create(username="test")
+        start = datetime.date(2020, 1, 1)
+        for i, kg in enumerate([80, 0, 0, 86, 0]):
+            Log.objects.create(
+                user=user,
+                date=start + datetime.timedelta(days=i),
+                weight=Weight(kg=kg),
+                calories_in=2000,
+            )
+
+        out = StringIO()
+        call_command("backfill_imputed_weights", stdout=out)
+        self.assertIn("3 logs updated", out.getvalue())
+        logs = Log.objects.filter(user=user).order_by("date")
+        self.assertEqual(
+            [round(log.weight.kg, 2) for log in logs], [80, 82, 84, 86, 83]
+        )
+        self.assertEqual(
+            [log.weight_imputed for log in logs], [False, True, True, False, True]
+        )
+        # Imputed weights are not logged weights
+        series = LogSeries.from_queryset(logs)
+        self.assertEqual((series.weights == 0).sum(), 3)
+
+        self.assertEqual(backfill_imputed_weights(user), 0)
+        merge_logs(
+            user, True, weights={start + datetime.timedelta(days=3): Weight(kg=83)}
+        )
+        self.assertEqual(backfill_imputed_weights(user), 3)
+        self.assertEqual(
+            round(
+                Log.objects.get(user=user, date=datetime.date(2020, 1, 2)).weight.kg, 2
+            ),
+            81,
+        )
+
+
+class LogChangesTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test")
+        self.logs = [
+            Log.objects.create(
+                user=self.user,
+                date=datetime.date(2020, 1, 1) + datetime.timedelta(days=i),
+                weight=Weight(kg=80),
+                calories_in=2000,
+            )
+            for i in range(5)
+        ]
+        other = get_user_model().objects.create(username="other")
+        Log.objects.create(
+            user=other, date=datetime.date(2020, 1, 1), weight=0, calories_in=0
+        )
+        self.client.force_login(self.user)
+
+    def sync(self, since=None):
+        """
+        Pages through the changes two at a time, returns the logs, deleted ids and the
+        next watermark
+        """
+
+        logs, deleted = [], []
+        params = {"since": since or "", "limit": 2}
+        while True:
+            response = self.client.get(reverse("log-changes"), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page["logs"]) + len(page["deleted"]), 2)
+            logs += page["logs"]
+            deleted += [log["id"] for log in page["deleted"]]
+            if page["next"] is None:
+                return logs, deleted, page["watermark"]
+            params = {"cursor": page["next"], "limit": 2}
+
+    @mock.patch("calorietracker.logsync_views.WATERMARK_LAG", datetime.timedelta(0))
+    def test_sync(self):
+        logs, deleted, watermark = self.sync()
+        self.assertEqual([log["id"] for log in logs], [log.pk for log in self.logs])
+        self.assertEqual(logs[0]["weight_kg"], 80)
+        self.assertEqual(deleted, [])
+
+        ids = [log.pk for log in self.logs]
+        self.logs[0].calories_in = 1800
+        self.logs[0].save()
+        self.logs[1].delete()
+        self.logs[2].delete(force_policy=HARD_DELETE)
+        self.logs[3].delete(force_policy=HARD_DELETE)
+        created = Log.objects.create(
+            user=self.user, date=datetime.date(2020, 2, 1), weight=0, calories_in=0
+        )
+
+        logs, deleted, watermark = self.sync(watermark)
+        self.assertEqual([log["id"] for log in logs], [ids[0], created.pk])
+        self.assertEqual(logs[0]["calories_in"], 1800)
+        self.assertEqual(sorted(deleted), ids[1:4])
+
+        self.assertEqual(self.sync(watermark)[:2], ([], []))
+        response = self.client.get(reverse("log-changes"), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+
+class LogTableDataTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="test")
+        self.user.setting.unit_preference = "M"
+        self.user.setting.save()
+        start = datetime.date(2020, 1, 1)
+        for i, kg in enumerate([80, 82, 81, 79, 83]):
+            Log.objects.create(
+                user=self.user,
+                date=start + datetime.timedelta(days=i),
+                weight=Weight(kg=kg),
+                calories_in=2000 + i,
+            )
+        other = get_user_model().objects.create(username="other")
+        Log.objects.create(user=other, date=start, weight=0, calories_in=0)
+        self.client.force_login(self.user)
+
+    def rows(self, **params):
+        """
+        Pages through the table two rows at a time, returns the rows and the total
+        """
+
+        params["limit"] = 2
+        response = self.client.get(reverse("logs-data"), params)
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        rows, total = page["data"], page["total"]
+        while page["next"]:
+            params["cursor"] = page["next"]
+            page = self.client.get(reverse("logs-data"), params).json()
+            self.assertIsNone(page["total"])
+            rows += page["data"]
+        return rows, total
+
+    def test_pages(self):
+        rows, total = self.rows()
+        self.assertEqual(total, 5)
+        self.assertEqual(
+            [row["date"] for row in rows],
+            ["2020-01-05", "2020-01-04", "2020-01-03", "2020-01-02", "2020-01-01"],
+        )
+        self.assertEqual(rows[0]["weight"], 83)
+
+        rows, _ = self.rows(order="weight")
+        self.assertEqual([row["weight"] for row in rows], [79, 80, 81, 82, 83])
+        rows, _ = self.rows(order="-calories_in")
+        self.assertEqual(
+            [row["calories_in"] for row in rows], [2004, 2003, 2002, 2001, 2000]
+        )
+
+        rows, total = self.rows(
+            order="date", date_from="2020-01-02", date_to="2020-01-04"
+        )
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            [row["date"] for row in rows], ["2020-01-02", "2020-01-03", "2020-01-04"]
+        )
+
+        response = self.client.get(reverse("logs-data"), {"order": "id"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_imputed_weights(self):
+        Log.objects.create(
+            user=self.user,
+            date=datetime.date(2020, 1, 6),
+            weight=Weight(kg=0),
+            calories_in=2005,
+        )
+        backfill_imputed_weights(self.user)
+
+        rows, _ = self.rows()
+        self.assertEqual(
+            [(row["weight"], row["imputed"]) for row in rows[:2]],
+            [(81, True), (83, False)],
+        )
+
+
+class PayloadsTest(TestCase):
+    def test_payloads(self):
+        rows = [{"b": 1, "a": "</script>"}, {"b": 2, "a": "x"}]
+        self.assertEqual(
+            payloads.dumps(payloads.columns(rows, ["b", "a"])),
+            '{"b":[1,2],"a":["\\u003C/script\\u003E","x"]}',
+        )
+        ordinals = [
+            datetime.date(1970, 1, 2).toordinal(),
+            datetime.date(2020, 6, 14).toordinal(),
+        ]
+        self.assertEqual(payloads.epoch_days(ordinals), [1, 18427])
+        self.assertEqual(payloads.iso_dates(ordinals), ["1970-01-02", "2020-06-14"])
+
+
+class LogIndexTest(TestCase):
+    def test_log_series_query_is_covered(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Checks an SQLite query plan")
+        user = get_user_model().objects.create(username="test")
+        with CaptureQueriesContext(connection) as queries:
+            LogSeries.from_queryset(Log.objects.filter(user=user), ids=True)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + queries[0]["sql"])
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("COVERING INDEX log_user_date_live_idx", plan)
+
+
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+)
+class ConcurrentImportTest(TransactionTestCase):
+    def test_imports_and_dashboard_reads_in_parallel(self):
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA busy_timeout")
+                self.assertEqual(cursor.fetchone()[0], 20000)
+
+        start = datetime.date(2020, 1, 1)
+        users = []
+        for i in range(3):
+            user = get_user_model().objects.create(username="test%d" % i)
+            user.setting.goal_date = datetime.datetime.now(
+                datetime.timezone.utc
+            ) + datetime.timedelta(days=30)
+            user.setting.save()
+            # The dashboard needs a log to show
+            Log.objects.create(
+                user=user,
+                date=start - datetime.timedelta(days=1),
+                weight=Weight(kg=81),
+                calories_in=2000,
+            )
+            users.append(user)
+        errors = []
+
+        def run(target, user):
+            try:
+                target(user)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # Each thread has its own connection
+                connection.close()
+
+        def import_logs(user):
+            for chunk in range(4):
+                days = [
+                    start + datetime.timedelta(days=chunk * 30 + i) for i in range(30)
+                ]
+                merge_logs(
+                    user,
+                    True,
+                    weights={day: Weight(kg=80) for day in days},
+                    calories_in={day: 2000 for day in days},
+                    chunk_size=10,
+                )
+
+        def read_dashboard(user):
+            client = Client()
+            client.force_login(user)
+            for _ in range(4):
+                for name in ("analytics", "logs"):
+                    response = client.get(reverse(name))
+                    if response.status_code != 200:
+                        raise AssertionError(
+                            "%s returned %d" % (name, response.status_code)
+                        )
+
+        threads = [
+            threading.Thread(target=run, args=(target, user))
+            for user in users
+            for target in (import_logs, read_dashboard)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for user in users:
+            self.assertEqual(Log.objects.filter(user=user).count(), 121)
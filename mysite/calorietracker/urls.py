@@ -7,9 +7,11 @@ urlpatterns = [
     path("profile/", views.Profile.as_view(), name="profile"),
     path("logdata/", views.LogData.as_view(), name="logdata"),
     path("logs/", views.ViewLogs.as_view(), name="logs"),
+    path("logs/data/", views.LogTableData.as_view(), name="logs-data"),
     path("logdata/<pk>/update/", views.UpdateLogData.as_view(), name="UpdateLogData"),
     path("logdata/<pk>/delete/", views.DeleteLogData.as_view(), name="DeleteLogData"),
     path("analytics/", views.Analytics.as_view(), name="analytics"),
+    path("api/logs/changes/", views.LogChanges.as_view(), name="log-changes"),
     # AUTH
     path("register/", views.Register.as_view(), name="register"),
     path("login/", views.Login.as_view(), name="login"),
@@ -20,6 +22,13 @@ urlpatterns = [
     # IMPORT
     path("import/csv", views.ImportCSV.as_view(), name="importcsv"),
     path("import/mfp", views.ImportMFP.as_view(), name="importmfp"),
+    path("import/jobs/<int:pk>/", views.ImportJobStatus.as_view(), name="import-job"),
+    path(
+        "import/jobs/<int:pk>/progress/",
+        views.ImportJobProgress.as_view(),
+        name="import-job-progress",
+    ),
+    path("import/mfp/traffic/", views.MFPTraffic.as_view(), name="mfp-traffic"),
     path(
         "import/credentials/mfp/",
         views.ImportMFPCredentials.as_view(),
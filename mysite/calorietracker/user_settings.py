@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from .models import Setting
+
+# Settings the analytics need before they can be calculated
+REQUIRED_SETTINGS = [
+    "age",
+    "sex",
+    "height",
+    "activity",
+    "goal",
+    "goal_weight",
+    "goal_date",
+    "unit_preference",
+]
+
+
+class UserSettings:
+    """
+    Read-only view of a user's Setting with the values converted to what the views use.
+    Use get_user_settings(request) to get the one shared by everything handling a request.
+    """
+
+    def __init__(self, setting):
+        self.setting = setting  # the Setting model instance, e.g. for UpdateViews
+
+        self.age = setting.age
+        self.sex = setting.sex
+        self.height = setting.height.cm if setting.height else None  # cm
+        self.activity = setting.activity
+        self.goal = setting.goal
+        self.goal_weight = (
+            setting.goal_weight.lb if setting.goal_weight else None
+        )  # lbs
+        self.goal_date = setting.goal_date
+        self.unit_preference = setting.unit_preference
+
+    def missing(self):
+        """
+        Returns the name of the first required setting that is not filled out, or None
+        """
+        for var in REQUIRED_SETTINGS:
+            if not getattr(self.setting, var):
+                return var
+        return None
+
+    def goal_date_passed(self):
+        return (self.goal_date - datetime.now(timezone.utc)).days < 0
+
+
+def get_user_settings(request):
+    """
+    Returns the UserSettings of request.user, loading them only once per request
+    """
+    if not hasattr(request, "_user_settings"):
+        request._user_settings = UserSettings(Setting.objects.get(user=request.user))
+    return request._user_settings
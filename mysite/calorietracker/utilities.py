@@ -2,10 +2,9 @@ import os
 import sys
 
 import numpy as np
-import pandas as pd
-import statsmodels.api as sm
-import statsmodels.formula.api as smf
-from sklearn.linear_model import LinearRegression
+
+# statsmodels and scikit-learn take seconds to import and are only used by the regression
+# helpers below, so they are imported there instead of on every worker boot
 
 
 # Regression - Single Variable
@@ -26,6 +25,8 @@ def single_regression(X, Y):
         Class with attributes coef_, rank, singular_, intercept_
     """
 
+    from sklearn.linear_model import LinearRegression
+
     linear_regressor = LinearRegression()  #  object for the class
     model = linear_regressor.fit(X, Y)  # perform regression
 
@@ -57,6 +58,8 @@ def sci_multiple_regression(X, Y):
         Class with attributes coef_, rank, singular_, intercept_
     """
 
+    from sklearn.linear_model import LinearRegression
+
     linear_regressor = LinearRegression()  #  object for the class
     model = linear_regressor.fit(X, Y)  # perform regression
     response = model.predict(X)
@@ -86,6 +89,8 @@ def sm_multiple_regression(x, y):
     OLSResults
         https://www.statsmodels.org/stable/generated/statsmodels.regression.linear_model.OLSResults.html#statsmodels.regression.linear_model.OLSResults
     """
+    import statsmodels.api as sm
+
     ones = np.ones(len(x[0]))
     X = sm.add_constant(np.column_stack((x[0], ones)))
     for ele in x[1:]:
@@ -173,6 +178,94 @@ def calculate_TDEE(CI, weights, n, units="lbs", smooth=True, window=5):
     return round(TDEE)
 
 
+def rolling_TDEE(CI, weights, windows, n, units="lbs", smooth=True, window=5):
+    """
+    calculate_TDEE() for many windows of the same series at once.
+
+    Instead of re-smoothing and re-summing every window, the weights are smoothed once
+    and the caloric intake is summed with a cumulative sum, so every window costs O(1).
+    The results are identical to calling calculate_TDEE(CI[start:stop], weights[start:stop], ...)
+    for each window as long as CI holds integers.
+
+    Parameters
+    ----------
+    CI : daily caloric intake
+        list or array
+    weights : daily weights
+        list or array
+    windows : (start, stop) indices of each window, as for slicing
+        list of tuples
+    n : last number of days to calculate TDEE over, for all windows or per window
+        int or list
+    units : unit of weights
+        string: "lbs" or "kgs"
+    smooth : If true, the daily weights are smoothed with moving_average()
+        bool, default = True
+    window : If smooth is true, the window over which averages will be computed
+        int, default = 5 (Days)
+
+    Returns
+    -------
+    list
+        TDEE of each window as int, or "Insufficient data" where calculate_TDEE() would return it
+    """
+
+    CI = np.asarray(CI)
+    weights = np.asarray(weights, dtype=float)
+    length = len(weights)
+
+    bounds = np.asarray(windows, dtype=np.int64).reshape(-1, 2)
+    start = np.clip(bounds[:, 0], 0, length)
+    stop = np.clip(bounds[:, 1], start, length)
+    size = stop - start
+    n = np.broadcast_to(np.asarray(n, dtype=np.int64), size.shape)
+
+    # Weights smoothed once over the whole series. The moving average of a window is
+    # the slice of it that starts at the window's start.
+    smoothed = smooth & (size >= window)
+    if smooth and length >= window:
+        series = moving_average(weights, window)
+    else:
+        series = np.empty(0)
+    m = np.where(smoothed, size - window + 1, size)  # number of weights in each window
+
+    # weights[-n:]
+    first = np.where(n >= 1, np.maximum(m - n, 0), np.minimum(-n, m))
+    count = m - first
+
+    def take(values, index):
+        if not len(values):
+            return np.zeros(len(index))
+        return values[np.clip(index, 0, len(values) - 1)]
+
+    first_weight = np.where(
+        smoothed, take(series, start + first), take(weights, start + first)
+    )
+    last_weight = np.where(
+        smoothed, take(series, start + m - 1), take(weights, start + m - 1)
+    )
+
+    if units == "lbs":
+        delta_weight_calories = (last_weight - first_weight) * 3500
+    elif units == "kgs":
+        delta_weight_calories = (last_weight - first_weight) * 7700
+
+    # sum(CI[-n + 1 : -2])
+    prefix = np.concatenate(([0], np.cumsum(CI)))
+    ci_start = np.where(n >= 2, np.maximum(size - n + 1, 0), np.minimum(1 - n, size))
+    ci_stop = np.maximum(size - 2, 0)
+    ci_start = np.minimum(ci_start, ci_stop)
+    ci_sum = prefix[start + ci_stop] - prefix[start + ci_start]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        TDEE = (delta_weight_calories - ci_sum) / count
+
+    return [
+        round(float(TDEE[i])) if size[i] >= 3 else "Insufficient data"
+        for i in range(len(size))
+    ]
+
+
 def moving_average(x, w=5):
     """
     Helper function for smoothing an array or list (x) over a window (w). Window is the number of elements over which to smooth
@@ -251,6 +344,8 @@ if __name__ == "__main__":
 
     # Connect to Django ORM
     import django
+    import pandas as pd
+    import statsmodels.formula.api as smf
 
     django.setup()
 
@@ -3,7 +3,6 @@ from djstripe.models import Plan, Customer
 import json
 import logging
 from datetime import datetime, timezone
-import pandas as pd
 
 from chartjs.views.lines import BaseLineChartView
 from django.contrib import messages
@@ -12,7 +11,6 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView, LogoutView, PasswordChangeView
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
-from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
@@ -30,13 +28,18 @@ from . import models
 from .analytics_view import Analytics
 from .csvimport_view import ImportCSV
 from .forms import LogDataForm, LoginForm, MeasurementWidget, RegisterForm, SettingForm
+from .importjob_views import ImportJobProgress, ImportJobStatus
+from .logsync_views import LogChanges
+from .logtable_views import LogTableData
 from .mfpimport_views import (
     ImportMFP,
     ImportMFPCredentials,
     ImportMFPCredentialsCreate,
     ImportMFPCredentialsUpdate,
+    MFPTraffic,
 )
 from .models import Feedback, Log, MFPCredentials, Setting
+from .user_settings import get_user_settings
 
 import json
 from django.http import HttpResponse
@@ -166,6 +169,8 @@ class UpdateLogData(LoginRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
+        if "weight" in form.changed_data:
+            form.instance.weight_imputed = False
         return super().form_valid(form)
 
 
@@ -249,7 +254,7 @@ class Settings(LoginRequiredMixin, UpdateView):
         return super().get(request, *args, **kwargs)
 
     def get_object(self):
-        return self.request.user.setting
+        return get_user_settings(self.request).setting
 
     def get_form(self):
         form = super().get_form()
@@ -273,38 +278,6 @@ class Profile(TemplateView):
 class ViewLogs(TemplateView):
     template_name = "calorietracker/logstable.html"
 
-    def load_data(self, **kwargs):
-        self.query_set = (
-            Log.objects.all()
-            .filter(user=self.request.user)
-            .values("id", "date", "weight", "calories_in")
-            .order_by("date")
-        )
-        df_query = pd.DataFrame(list(self.query_set))
-        settings_set = Setting.objects.all().filter(user=self.request.user).values()
-        df_settings = pd.DataFrame(list(settings_set))
-
-        self.units = df_settings["unit_preference"].all()
-
-        # weights, calories_in, dates
-        self.rawweights = df_query["weight"].tolist()
-        self.weights = df_query["weight"].tolist()
-        self.weights = [round(x.lb, 2) for x in self.weights]
-        self.calories_in = df_query["calories_in"].tolist()
-        self.dates = df_query["date"].tolist()
-        self.ids = df_query["id"].tolist()
-
-        # Unit control
-        # NOTE: all initial calculations above are done in imperial.
-        # We convert to metric as needed at the very end here.
-        if self.units == "I":
-            self.unitsweight = "lbs"
-        elif self.units == "M":
-            self.unitsweight = "kgs"
-            self.weights = [round(x.kg, 2) for x in self.rawweights]
-
-        self.logtabledata = self.get_logtabledata()
-
     def dispatch(self, request):
 
         if not self.request.user.is_authenticated:
@@ -315,30 +288,14 @@ class ViewLogs(TemplateView):
 
         return super().dispatch(request)
 
-    def get_logtabledata(self):
-        logtabledata = []
-        for i in range(len(self.weights)):
-            entry = {}
-            entry["id"] = self.ids[i]
-            entry["date"] = self.dates[i]
-            entry["weight"] = self.weights[i]
-            entry["calories_in"] = self.calories_in[i]
-            logtabledata.append(entry)
-        return logtabledata
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        self.load_data()
 
+        # The rows are loaded a page at a time from LogTableData
+        units = get_user_settings(self.request).unit_preference
         context = {
-            "units": self.units,
-            "units_weight": self.unitsweight,
-            "logjson_data": json.dumps(
-                {"data": self.logtabledata},
-                sort_keys=True,
-                indent=1,
-                cls=DjangoJSONEncoder,
-            ),
+            "units": units,
+            "units_weight": "kgs" if units == "M" else "lbs",
         }
         return context
 